@@ -0,0 +1,159 @@
+# bench_render.py
+#
+# Render benchmark: composites synthetic static and animated overlays onto
+# the shirt with every encoder preset and reports render time, encode time,
+# encode attempts and output bytes. Then compares the plain LANCZOS resize
+# with the draft/reduce downscale path on large photo-sized overlays.
+#
+# Usage: python bench_render.py [base_image] [repeats]
+
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+
+import sticker_encode
+from sticker_encode import PRESETS
+from shirt_templates import ShirtTemplate
+from sticker_render import finish_overlay, reduce_overlay, render_sticker, use_draft
+
+# ====================== Configuration ======================
+
+DEFAULT_BASE_IMAGE = 'camisetabasica.jpg'
+DEFAULT_REPEATS = 3
+ANIMATED_FRAMES = 24
+LARGE_INPUTS = [('photo 12MP', (4032, 3024), 'JPEG'), ('png 16MP', (4000, 4000), 'PNG')]
+DOWNSCALE_TARGET = (190, 190)  # Overlay box on a 512x512 sticker
+
+# ====================== Synthetic Overlays ======================
+
+def make_static_overlay(path, size=512):
+    image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, size, 16):
+        draw.ellipse((i // 2, i // 2, size - i // 2, size - i // 2),
+                     outline=(i % 256, 255 - i % 256, 128, 255), width=6)
+    image.save(path, 'PNG')
+    return path
+
+def make_animated_overlay(path, size=512, frames=ANIMATED_FRAMES):
+    images = []
+    for n in range(frames):
+        image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        offset = n * size // (2 * frames)
+        draw.ellipse((offset, offset, offset + size // 2, offset + size // 2),
+                     fill=(255, 40 + n * 8, 40, 255))
+        draw.text((10, 10), f"frame {n}", fill=(0, 0, 0, 255))
+        images.append(image)
+    images[0].save(path, 'WEBP', save_all=True, append_images=images[1:], duration=60, loop=0)
+    return path
+
+def make_large_overlay(path, size, image_format):
+    # Smooth gradients plus blurred detail, roughly like a phone photo
+    width, height = size
+    image = Image.merge("RGB", [
+        Image.linear_gradient("L").resize(size),
+        Image.radial_gradient("L").resize(size),
+        Image.effect_noise((width // 8, height // 8), 40).resize(size, Image.BICUBIC),
+    ])
+    draw = ImageDraw.Draw(image)
+    for i in range(0, min(size), 97):
+        draw.line((0, i, width, height - i), fill=(255, 255, 0), width=9)
+    image = image.filter(ImageFilter.GaussianBlur(2))
+    if image_format == 'PNG':
+        image.putalpha(255)
+    image.save(path, image_format)
+    return path
+
+# ====================== Benchmark ======================
+
+def naive_downscale(path, size):
+    with Image.open(path) as image:
+        return image.convert("RGBA").resize(size, Image.LANCZOS)
+
+def fast_downscale(path, size):
+    with Image.open(path) as image:
+        use_draft(image, size)
+        return finish_overlay(reduce_overlay(image, size), size)
+
+def bench_downscale(path, size, repeats):
+    """
+    Returns (naive ms, fast ms, mean abs difference, max abs difference).
+    Differences are per channel on a 0-255 scale.
+    """
+    timings = {}
+    results = {}
+    for label, downscale in (('naive', naive_downscale), ('fast', fast_downscale)):
+        best = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            results[label] = downscale(path, size)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best * 1000
+    diff = ImageChops.difference(results['naive'], results['fast']).convert("RGB")
+    mean_diff = sum(ImageStat.Stat(diff).mean) / 3
+    max_diff = max(high for _, high in diff.getextrema())
+    return timings['naive'], timings['fast'], mean_diff, max_diff
+
+def bench(template, overlay_path, output_path, preset, repeats):
+    """
+    Returns (best total seconds, attempts on the first run, last result).
+    The first run searches for a quality; later runs start from the cache.
+    """
+    best_total = None
+    cold_attempts = None
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = render_sticker(template, overlay_path, output_path, preset=preset)
+        total = time.perf_counter() - started
+        best_total = total if best_total is None else min(best_total, total)
+        if cold_attempts is None:
+            cold_attempts = result.attempts
+    return best_total, cold_attempts, result
+
+def main(argv):
+    base_image_path = argv[0] if argv else DEFAULT_BASE_IMAGE
+    repeats = int(argv[1]) if len(argv) > 1 else DEFAULT_REPEATS
+    if not os.path.exists(base_image_path):
+        print(f"Base image '{base_image_path}' not found.")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the benchmark from touching the real encoder settings cache
+        sticker_encode.ENCODER_CACHE_PATH = os.path.join(tmp, 'encoder_settings.json')
+        sticker_encode._encoder_cache = None
+
+        template = ShirtTemplate(os.path.basename(base_image_path), base_image_path).preload()
+        overlays = [
+            ('static', make_static_overlay(os.path.join(tmp, 'static.png'))),
+            ('animated', make_animated_overlay(os.path.join(tmp, 'animated.webp'))),
+        ]
+        output_path = os.path.join(tmp, 'out.webp')
+
+        print(f"{'overlay':<10} {'preset':<10} {'total ms':>9} {'encode ms':>10} "
+              f"{'attempts':>9} {'bytes':>8} {'quality':>8}")
+        for label, overlay_path in overlays:
+            for preset in PRESETS:
+                total, cold_attempts, result = bench(template, overlay_path, output_path, preset, repeats)
+                quality = 'lossless' if result.lossless else str(result.quality)
+                flag = '' if result.fits else '  over budget'
+                print(f"{label:<10} {preset:<10} {total * 1000:9.1f} {result.seconds * 1000:10.1f} "
+                      f"{cold_attempts:>4}/{result.attempts:<4} {len(result.data):8d} {quality:>8}{flag}")
+
+        print()
+        print(f"Large overlay downscale to {DOWNSCALE_TARGET[0]}x{DOWNSCALE_TARGET[1]}")
+        print(f"{'input':<12} {'naive ms':>9} {'fast ms':>9} {'speedup':>8} {'mean diff':>10} {'max diff':>9}")
+        for label, size, image_format in LARGE_INPUTS:
+            path = make_large_overlay(os.path.join(tmp, f"large.{image_format.lower()}"), size, image_format)
+            naive_ms, fast_ms, mean_diff, max_diff = bench_downscale(path, DOWNSCALE_TARGET, repeats)
+            print(f"{label:<12} {naive_ms:9.1f} {fast_ms:9.1f} {naive_ms / fast_ms:7.1f}x "
+                  f"{mean_diff:10.2f} {max_diff:9d}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+# bench_service.py
+#
+# Usage: python bench_service.py [url] [connections] [requests] [distinct overlays]
+#
+# Load test for render_service.py. Each connection is a thread with one
+# keep-alive HTTP connection, posting overlays to /render until `requests`
+# have been sent in total. Overlays are drawn from `distinct` synthetic
+# images, so the render cache sees repeats once each has been rendered.
+# Without a url, a service is started in this process on a free port.
+# Defaults: 4 connections, 200 requests, 20 distinct overlays.
+
+import http.client
+import io
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from PIL import Image, ImageDraw
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_REQUESTS = 200
+DEFAULT_DISTINCT = 20
+
+def make_overlays(count, size=(400, 400)):
+    overlays = []
+    for i in range(count):
+        image = Image.new('RGBA', size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((20, 20, size[0] - 20, size[1] - 20), fill=((i * 53) % 256, (i * 97) % 256, 160, 255))
+        draw.text((size[0] // 3, size[1] // 2), f"#{i}", fill=(255, 255, 255, 255))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        overlays.append(buffer.getvalue())
+    return overlays
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run_load(host, port, connections, total, overlays):
+    counter = iter(range(total))
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    hits = [0]
+
+    def client():
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                break
+            body = overlays[n % len(overlays)]
+            started = time.perf_counter()
+            try:
+                conn.request('POST', '/render?preset=fast', body, {'Content-Type': 'image/png'})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                hit = response.getheader('X-Render-Cache') == 'hit'
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+                status, hit = 'error', False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                hits[0] += hit
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, statuses, hits[0]
+
+def main(argv):
+    url = argv[0] if len(argv) > 0 and '://' in argv[0] else None
+    numbers = [int(a) for a in argv[1 if url else 0:]]
+    connections = numbers[0] if len(numbers) > 0 else DEFAULT_CONNECTIONS
+    total = numbers[1] if len(numbers) > 1 else DEFAULT_REQUESTS
+    distinct = numbers[2] if len(numbers) > 2 else DEFAULT_DISTINCT
+
+    server = None
+    if url:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        from render_service import make_server
+        server = make_server(port=0)
+        host, port = server.server_address[:2]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    overlays = make_overlays(distinct)
+    print(f"Load test: {total} requests over {connections} keep-alive connection(s), "
+          f"{distinct} distinct overlays, http://{host}:{port}/render")
+    try:
+        elapsed, latencies, statuses, hits = run_load(host, port, connections, total, overlays)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    ok = statuses.get(200, 0)
+    print(f"{total / elapsed:.1f} requests/s over {elapsed:.2f}s; "
+          f"{ok} ok, {hits} cache hits ({hits / max(1, ok):.0%})")
+    print(f"latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    failures = {status: count for status, count in statuses.items() if status != 200}
+    if failures:
+        print(f"failures: {failures}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,83 @@
+# bench_sessions.py
+#
+# Usage: python bench_sessions.py [sender counts...]
+#
+# Memory of the per-sender state in whatsapp_monitor.py: the old layout
+# (processed_senders set, responded_messages dict of sets, and the chat
+# tracker's TrackedChat objects with (type, content) cursors) against
+# SessionTable. Every sender has sent a sticker, half of them also a
+# trigger, and every chat is watched. Sender names and message texts are
+# created before measuring, since both layouts hold the same strings.
+
+import sys
+import time
+import tracemalloc
+
+from session_table import SessionTable
+
+DEFAULT_COUNTS = [100_000, 1_000_000]
+TRIGGERS = ["hello", "how are you doing", "hello3"]
+
+# ====================== Old Layout ======================
+
+class TrackedChat:
+    __slots__ = ('last_activity', 'last_checked', 'cursor')
+
+    def __init__(self, now):
+        self.last_activity = now
+        self.last_checked = now
+        self.cursor = None
+
+def fill_legacy(senders, contents):
+    processed_senders = set()
+    responded_messages = {}
+    open_chats = {}
+    for i, sender in enumerate(senders):
+        chat = open_chats[sender] = TrackedChat(time.monotonic())
+        chat.cursor = ("text", contents[i])
+        chat.last_checked = time.monotonic()
+        if i % 2:
+            responded_messages.setdefault(sender, set()).add(TRIGGERS[i % len(TRIGGERS)])
+        processed_senders.add(sender)
+    return processed_senders, responded_messages, open_chats
+
+# ====================== Session Table ======================
+
+def fill_table(senders, contents):
+    table = SessionTable()
+    for i, sender in enumerate(senders):
+        table.touch(sender)
+        table.advance(sender, ("text", contents[i]))
+        if i % 2:
+            table.mark_responded(sender, i % len(TRIGGERS))
+        table.set_processed(sender)
+    return table
+
+# ====================== Benchmark ======================
+
+def measure(fill, senders, contents):
+    tracemalloc.start()
+    started = time.perf_counter()
+    state = fill(senders, contents)
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del state
+    return size, elapsed
+
+def main(argv):
+    counts = [int(a) for a in argv] or DEFAULT_COUNTS
+    print(f"{'senders':>10} {'layout':<14} {'MB':>8} {'B/sender':>9} {'build s':>8}")
+    for count in counts:
+        senders = [f"+55 11 9{i:08d}" for i in range(count)]
+        contents = [f"message {i}" for i in range(count)]
+        results = {}
+        for name, fill in (('old', fill_legacy), ('session table', fill_table)):
+            size, elapsed = measure(fill, senders, contents)
+            results[name] = size
+            print(f"{count:>10} {name:<14} {size / 1024 / 1024:>8.1f} {size / count:>9.0f} {elapsed:>8.2f}")
+        print(f"{'':>10} {'saving':<14} {1 - results['session table'] / results['old']:>8.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
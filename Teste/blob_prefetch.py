@@ -0,0 +1,128 @@
+# blob_prefetch.py
+#
+# Batched fetch of sticker blobs through the browser.
+#
+# blob: URLs only resolve inside the WhatsApp page, and only while the page
+# holds them. Instead of one execute_async_script round trip per sticker,
+# the monitor adds every new sticker URL it sees during a pass to a
+# BlobPrefetcher and flushes it once: a single script fetches them all
+# inside the page, at most PREFETCH_CONCURRENCY at a time, and returns the
+# bytes together. Nothing downstream needs the browser to get media.
+
+import base64
+
+# ====================== Configuration ======================
+
+PREFETCH_CONCURRENCY = 4  # Parallel fetches inside the page
+MAX_BATCH = 16  # URLs per script call, keeps each call well under the script timeout
+
+FETCH_BLOBS_SCRIPT = """
+    const urls = arguments[0];
+    const limit = arguments[1];
+    const callback = arguments[arguments.length - 1];
+    const results = new Array(urls.length).fill(null);
+    let next = 0;
+
+    const readAsDataURL = blob => new Promise((resolve, reject) => {
+        const reader = new FileReader();
+        reader.onloadend = () => resolve(reader.result);
+        reader.onerror = reject;
+        reader.readAsDataURL(blob);
+    });
+
+    async function worker() {
+        while (next < urls.length) {
+            const i = next++;
+            try {
+                const response = await fetch(urls[i]);
+                results[i] = await readAsDataURL(await response.blob());
+            } catch (e) {
+                results[i] = null;
+            }
+        }
+    }
+
+    const workers = [];
+    for (let w = 0; w < Math.min(limit, urls.length); w++) {
+        workers.push(worker());
+    }
+    Promise.all(workers).then(() => callback(results));
+"""
+
+# ====================== Helper Functions ======================
+
+def fetch_blobs(driver, urls, concurrency=PREFETCH_CONCURRENCY):
+    """
+    Fetches blob URLs in one script call. Returns a list of bytes (or None
+    for each URL that could not be read), in the order of urls.
+    """
+    data_urls = driver.execute_async_script(FETCH_BLOBS_SCRIPT, list(urls), concurrency)
+    results = []
+    for data_url in data_urls or [None] * len(urls):
+        if data_url:
+            _, encoded = data_url.split(',', 1)
+            results.append(base64.b64decode(encoded))
+        else:
+            results.append(None)
+    return results
+
+# ====================== Prefetcher ======================
+
+class BlobPrefetcher:
+    def __init__(self, concurrency=PREFETCH_CONCURRENCY, max_batch=MAX_BATCH):
+        self.concurrency = concurrency
+        self.max_batch = max_batch
+        self.round_trips = 0
+        self.fetched = 0
+        self.failed = 0
+        self._pending = []  # (key, url)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, key, url):
+        """Queues url for the next flush; key (e.g. the sender) is returned with the bytes."""
+        self._pending.append((key, url))
+
+    def flush(self, driver):
+        """
+        Fetches everything queued. Returns [(key, url, bytes or None)].
+        Non-blob URLs are not page-bound and are fetched directly.
+        """
+        pending, self._pending = self._pending, []
+        results = []
+
+        blobs = [(key, url) for key, url in pending if url.startswith('blob:')]
+        for start in range(0, len(blobs), self.max_batch):
+            batch = blobs[start:start + self.max_batch]
+            try:
+                data = fetch_blobs(driver, [url for _, url in batch], self.concurrency)
+            except Exception as e:
+                print(f"Blob prefetch failed: {e}")
+                data = [None] * len(batch)
+            self.round_trips += 1
+            results.extend((key, url, d) for (key, url), d in zip(batch, data))
+
+        for key, url in pending:
+            if not url.startswith('blob:'):
+                results.append((key, url, self._fetch_url(url)))
+
+        self.fetched += sum(1 for _, _, d in results if d)
+        self.failed += sum(1 for _, _, d in results if not d)
+        return results
+
+    @staticmethod
+    def _fetch_url(url):
+        import requests
+
+        try:
+            response = requests.get(url, timeout=30)
+            if response.status_code == 200:
+                return response.content
+            print(f"Failed to download sticker. Status Code: {response.status_code}")
+        except Exception as e:
+            print(f"Download error: {e}")
+        return None
+
+    def describe(self):
+        return f"{self.fetched} fetched, {self.failed} failed in {self.round_trips} browser round trip(s)"
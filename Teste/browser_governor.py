@@ -0,0 +1,107 @@
+# browser_governor.py
+#
+# Keeps the WhatsApp Web tab from degrading over long runs.
+#
+# Every CHECK_INTERVAL seconds the governor probes the tab: JS heap in use
+# (performance.memory, Chrome only), DOM node count, and how long the
+# WebDriver round trip for the probe took (smoothed). When a limit is
+# crossed it asks for a reload, but only once the monitor is idle (no hot
+# chats, nothing rendering or queued) and at most once every
+# MIN_RELOAD_INTERVAL. The reload itself is the monitor's: it keeps the
+# login (the Chrome profile persists it) and its own per-sender state.
+
+import time
+
+# ====================== Configuration ======================
+
+HEAP_LIMIT_MB = 1024
+DOM_NODE_LIMIT = 150_000
+LATENCY_LIMIT = 2.0  # seconds, smoothed WebDriver round trip
+LATENCY_SMOOTHING = 0.3  # weight of the newest sample
+CHECK_INTERVAL = 60  # seconds between probes
+MIN_RELOAD_INTERVAL = 30 * 60
+
+PROBE_SCRIPT = """
+    const memory = performance.memory;
+    return [memory ? memory.usedJSHeapSize : null, document.getElementsByTagName('*').length];
+"""
+
+# ====================== Browser Governor ======================
+
+class BrowserGovernor:
+    def __init__(self, heap_limit_mb=HEAP_LIMIT_MB, dom_node_limit=DOM_NODE_LIMIT,
+                 latency_limit=LATENCY_LIMIT, check_interval=CHECK_INTERVAL,
+                 min_reload_interval=MIN_RELOAD_INTERVAL, clock=time.monotonic):
+        self.heap_limit_mb = heap_limit_mb
+        self.dom_node_limit = dom_node_limit
+        self.latency_limit = latency_limit
+        self.check_interval = check_interval
+        self.min_reload_interval = min_reload_interval
+        self.clock = clock
+        self.heap_mb = None
+        self.dom_nodes = None
+        self.latency = None
+        self.reloads = 0
+        self.deferred = 0  # checks over a limit that had to wait for an idle window
+        self._last_check = clock()
+        self._last_reload = clock()
+
+    def probe(self, driver):
+        """Reads heap and DOM size from the tab and times the round trip."""
+        started = time.perf_counter()
+        heap_bytes, dom_nodes = driver.execute_script(PROBE_SCRIPT)
+        elapsed = time.perf_counter() - started
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += LATENCY_SMOOTHING * (elapsed - self.latency)
+        self.heap_mb = heap_bytes / 1024 / 1024 if heap_bytes is not None else None
+        self.dom_nodes = dom_nodes
+        self._last_check = self.clock()
+
+    def over_limits(self):
+        """Reasons the tab needs a reload, from the last probe."""
+        reasons = []
+        if self.heap_mb is not None and self.heap_mb > self.heap_limit_mb:
+            reasons.append(f"JS heap {self.heap_mb:.0f} MB > {self.heap_limit_mb} MB")
+        if self.dom_nodes is not None and self.dom_nodes > self.dom_node_limit:
+            reasons.append(f"{self.dom_nodes} DOM nodes > {self.dom_node_limit}")
+        if self.latency is not None and self.latency > self.latency_limit:
+            reasons.append(f"WebDriver latency {self.latency:.2f}s > {self.latency_limit:.2f}s")
+        return reasons
+
+    def check(self, driver, idle, reload):
+        """
+        Probes the tab if a check is due and calls reload() if it is over a
+        limit and `idle` is True. Returns True if it reloaded.
+        """
+        if self.clock() - self._last_check < self.check_interval:
+            return False
+        try:
+            self.probe(driver)
+        except Exception as e:
+            print(f"Browser probe failed: {e}")
+            return False
+
+        reasons = self.over_limits()
+        if not reasons:
+            return False
+        if not idle or self.clock() - self._last_reload < self.min_reload_interval:
+            self.deferred += 1
+            return False
+
+        print(f"Reloading WhatsApp Web: {'; '.join(reasons)}")
+        reload()
+        self.reloads += 1
+        self._last_reload = self.clock()
+        # Start over so the old tab's latency does not count against the new one
+        self.latency = None
+        return True
+
+    # ---------- reporting ----------
+
+    def describe(self):
+        heap = f"{self.heap_mb:.0f} MB" if self.heap_mb is not None else 'n/a'
+        latency = f"{self.latency * 1000:.0f} ms" if self.latency is not None else 'n/a'
+        return (f"heap {heap}, {self.dom_nodes if self.dom_nodes is not None else 'n/a'} DOM nodes, "
+                f"WebDriver latency {latency}, {self.reloads} reload(s), {self.deferred} deferred")
@@ -0,0 +1,124 @@
+# check_startup.py
+#
+# Import-time regression check for sticker_handler.py.
+#
+# Runs the handler under `python -X importtime` for the paths that must stay
+# cheap (plain import, usage error, render-only) and fails if a forbidden
+# module gets imported or the cumulative import time goes over budget. A
+# real render of a small generated overlay is checked too: it may load
+# Pillow, but never the browser stack.
+#
+# Every check runs in a temporary directory holding a copy of the shirt
+# templates, so the render's encoder settings and template cache are
+# written there and not over the real ones.
+#
+# Usage: python check_startup.py [budget_ms]
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# ====================== Configuration ======================
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGET_MS = 150
+# What the render needs from HERE: the legacy base and the template directory
+TEMPLATE_FILES = ('camisetabasica.jpg', 'templates')
+
+# Modules that no cheap path is allowed to import
+NEVER_IMPORTED = ('selenium', 'requests', 'urllib3')
+
+# (label, argv, modules forbidden on top of NEVER_IMPORTED, held to the budget)
+# {handler} is sticker_handler.py; {overlay} and {output} are temporary paths.
+CHECKS = [
+    ('import', ['-c', 'import sticker_handler'], ('PIL',), True),
+    ('usage error', ['{handler}'], ('PIL',), True),
+    ('render bad path', ['{handler}', 'render', 'does-not-exist.png'], ('PIL',), True),
+    ('render', ['{handler}', 'render', '{overlay}', '{output}'], (), False),
+]
+
+# ====================== Helper Functions ======================
+
+def parse_importtime(stderr):
+    """
+    Parses `-X importtime` output.
+    Returns a dict of top-level package name -> cumulative microseconds.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        cumulative_us, name = int(fields[1]), fields[2]
+        # Nested imports are indented by two extra spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        top = name.strip().split('.')[0]
+        if depth == 0:
+            packages[top] = packages.get(top, 0) + cumulative_us
+        else:
+            packages.setdefault(top, 0)
+    return packages
+
+def make_overlay(path):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
+    ImageDraw.Draw(image).ellipse((4, 4, 60, 60), fill=(200, 40, 40, 255))
+    image.save(path)
+
+def prepare_workdir(work_dir):
+    """Copies the shirt templates into work_dir."""
+    for name in TEMPLATE_FILES:
+        source = os.path.join(HERE, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(work_dir, name))
+        elif os.path.isfile(source):
+            shutil.copy2(source, work_dir)
+
+def run_check(label, argv, forbidden, work_dir):
+    """Returns (cumulative import ms, forbidden modules imported, exit code)."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + argv,
+        cwd=work_dir, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONPATH=HERE)
+    )
+    packages = parse_importtime(result.stderr)
+    total_ms = sum(packages.values()) / 1000
+    leaked = sorted(p for p in packages if p in NEVER_IMPORTED + forbidden)
+    return total_ms, leaked, result.returncode
+
+# ====================== Execution ======================
+
+def main(argv):
+    budget_ms = float(argv[0]) if argv else DEFAULT_BUDGET_MS
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = {
+            'handler': os.path.join(HERE, 'sticker_handler.py'),
+            'overlay': os.path.join(tmp_dir, 'overlay.png'),
+            'output': os.path.join(tmp_dir, 'sticker.webp'),
+        }
+        prepare_workdir(tmp_dir)
+        make_overlay(paths['overlay'])
+        for label, args, forbidden, budgeted in CHECKS:
+            args = [arg.format(**paths) for arg in args]
+            total_ms, leaked, returncode = run_check(label, args, forbidden, tmp_dir)
+            status = 'ok'
+            if leaked:
+                status = f"FAIL (imported {', '.join(leaked)})"
+                failed = True
+            elif budgeted and total_ms > budget_ms:
+                status = f"FAIL (over {budget_ms:.0f} ms budget)"
+                failed = True
+            elif not budgeted and (returncode != 0 or not os.path.exists(paths['output'])):
+                status = f"FAIL (exit code {returncode}, no output)"
+                failed = True
+            print(f"{label:<16} {total_ms:8.1f} ms  {status}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -9,6 +9,7 @@ import time
 from urllib.parse import urlparse
 import base64
 import requests
+from poll_scheduler import PollScheduler
 
 # ====================== Configuration ======================
 
@@ -17,7 +18,7 @@ DOWNLOAD_DIR = os.path.join(os.getcwd(), 'stickers')
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 USER_DATA_DIR = os.path.abspath("User_Data_Selenium")
 WA_WEB_URL = 'https://web.whatsapp.com/'
-CHECK_INTERVAL = 10  # seconds
+POLL_LOG_INTERVAL = 600  # seconds between polling reports
 
 # ====================== Setup Chrome Options ======================
 
@@ -170,6 +171,7 @@ def get_latest_message():
 # ====================== Main Loop ======================
 
 processed_senders = set()
+poller = PollScheduler(log_interval=POLL_LOG_INTERVAL)
 
 print("Monitoring for new stickers...")
 
@@ -177,7 +179,8 @@ try:
     while True:
         sender = get_sender()
         if not sender:
-            time.sleep(CHECK_INTERVAL)
+            poller.idle()
+            poller.wait(driver)
             continue
 
         msg_type, content = get_latest_message()
@@ -186,7 +189,10 @@ try:
             if sender in processed_senders:
                 processed_senders.remove(sender)
                 print(f"Reset received from {sender}. They can send a new sticker now.")
-            time.sleep(CHECK_INTERVAL)
+                poller.detected()
+            else:
+                poller.idle()
+            poller.wait(driver)
             continue
 
         if msg_type == "sticker" and sender not in processed_senders:
@@ -196,8 +202,11 @@ try:
                 send_sticker(sender, sticker_path)
                 processed_senders.add(sender)
                 print(f"Processed sticker from {sender}. Awaiting reset command ('0').")
+                poller.detected()
+        else:
+            poller.idle()
         
-        time.sleep(CHECK_INTERVAL)
+        poller.wait(driver)
 
 except KeyboardInterrupt:
     print("Script terminated by user.")
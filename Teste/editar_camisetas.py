@@ -1,28 +1,205 @@
-from PIL import Image
+# editar_camisetas.py
+#
+# Usage: python editar_camisetas.py overlay_image.jpg
+#        python editar_camisetas.py [options] <files, directories or globs>...
+#
+# Pastes each overlay, centered, onto the shirt base and saves the result.
+# With a single file and no options the result is written to result.jpg, as
+# before. Otherwise it runs as a batch: results go to --output-dir, named by
+# --name, rendered by a pool of worker processes that each decode the base
+# once. Results newer than both their overlay and the base are skipped
+# unless --force is given.
+
+import argparse
+import glob
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ====================== Configuration ======================
+
+BASE_IMAGE_PATH = 'camisetabasica.jpg'
+LEGACY_OUTPUT = 'result.jpg'
+DEFAULT_OUTPUT_DIR = 'camisetas'
+DEFAULT_NAME = '{stem}.jpg'  # fields: {stem}, {name}, {parent}, {index}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+
+# ====================== Compositing ======================
+
+def compose(base_image, overlay_filename, output_path):
+    """Pastes the overlay centered onto a copy of the base and saves it."""
+    from PIL import Image
+
+    result = base_image.copy()
+    with Image.open(overlay_filename) as overlay_image:
+        # Get dimensions
+        base_width, base_height = result.size
+        overlay_width, overlay_height = overlay_image.size
+
+        # Calculate position to center the overlay
+        position = (
+            (base_width - overlay_width) // 2,
+            (base_height - overlay_height) // 2
+        )
+
+        # Paste the overlay image onto the base image
+        result.paste(overlay_image, position, overlay_image.convert("RGBA"))
+
+    # Write then rename, so an interrupted run never leaves a file that looks up to date
+    directory = os.path.dirname(output_path)
+    if directory:
+        # --name may put results in subdirectories, e.g. {parent}/{stem}.jpg
+        os.makedirs(directory, exist_ok=True)
+    root, extension = os.path.splitext(output_path)
+    tmp_path = f"{root}.{os.getpid()}.tmp{extension}"
+    result.save(tmp_path)
+    os.replace(tmp_path, output_path)
+    return result.width * result.height
+
+# ====================== Worker Side ======================
+
+_base = None  # Decoded once per worker by _load_base
+
+def _load_base(base_path):
+    global _base
+    from PIL import Image
+
+    _base = Image.open(base_path)
+    _base.load()
+
+def _render(overlay_filename, output_path):
+    return compose(_base, overlay_filename, output_path)
+
+# ====================== Batch ======================
+
+def expand_inputs(patterns):
+    """Files, directories (their images) and globs, in order, without duplicates."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(e.path for e in os.scandir(pattern)
+                             if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        files.extend(matches)
+
+    seen = set()
+    unique = []
+    for path in files:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+def output_name(template, overlay_filename, index):
+    name = os.path.basename(overlay_filename)
+    return template.format(
+        stem=os.path.splitext(name)[0],
+        name=name,
+        parent=os.path.basename(os.path.dirname(os.path.abspath(overlay_filename))),
+        index=index,
+    )
+
+def is_up_to_date(output_path, overlay_filename, base_path):
+    try:
+        output_mtime = os.path.getmtime(output_path)
+        return output_mtime >= max(os.path.getmtime(overlay_filename), os.path.getmtime(base_path))
+    except OSError:
+        return False
+
+def plan_batch(overlays, output_dir, template, base_path, force):
+    """
+    Returns (jobs, skipped): jobs are (overlay, output path) pairs still to
+    render. Raises ValueError if two overlays would write the same file.
+    """
+    jobs = []
+    skipped = []
+    targets = {}
+    for index, overlay_filename in enumerate(overlays, 1):
+        output_path = os.path.join(output_dir, output_name(template, overlay_filename, index))
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in targets:
+            raise ValueError(f"{overlay_filename} and {targets[key]} would both be written to "
+                             f"{output_path}; add {{parent}} or {{index}} to --name")
+        targets[key] = overlay_filename
+        if not force and is_up_to_date(output_path, overlay_filename, base_path):
+            skipped.append(overlay_filename)
+        else:
+            jobs.append((overlay_filename, output_path))
+    return jobs, skipped
+
+def run_batch(jobs, base_path, workers):
+    """Renders jobs in a process pool. Returns (done, failed, pixels)."""
+    done = 0
+    failed = 0
+    pixels = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_base, initargs=(base_path,)) as executor:
+        futures = {executor.submit(_render, overlay, output): (overlay, output) for overlay, output in jobs}
+        for future in as_completed(futures):
+            overlay, output = futures[future]
+            try:
+                pixels += future.result()
+                done += 1
+                print(f"{overlay} -> {output}")
+            except Exception as e:
+                failed += 1
+                print(f"Failed: {overlay}: {e}")
+    return done, failed, pixels
+
+def batch(args):
+    overlays = expand_inputs(args.inputs)
+    if not overlays:
+        print("No overlay images found.")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        jobs, skipped = plan_batch(overlays, args.output_dir, args.name, args.base, args.force)
+    except (ValueError, KeyError, IndexError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    started = time.perf_counter()
+    done = failed = pixels = 0
+    if jobs:
+        workers = max(1, min(args.jobs or os.cpu_count() or 1, len(jobs)))
+        done, failed, pixels = run_batch(jobs, args.base, workers)
+    elapsed = time.perf_counter() - started
 
-if len(sys.argv) != 2:
-    print("Usage: python script.py overlay_image.jpg")
-    sys.exit(1)
+    rate = f", {done / elapsed:.1f} images/s, {pixels / elapsed / 1e6:.1f} MP/s" if done and elapsed > 0 else ""
+    print(f"{done} rendered, {len(skipped)} up to date, {failed} failed in {elapsed:.1f}s{rate}")
+    return 1 if failed else 0
 
-overlay_filename = sys.argv[1]
+# ====================== Main ======================
 
-# Open the base and overlay images
-base_image = Image.open('camisetabasica.jpg')
-overlay_image = Image.open(overlay_filename)
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Paste overlays onto the shirt base.")
+    parser.add_argument('inputs', nargs='+', help="overlay images, directories or glob patterns")
+    parser.add_argument('-o', '--output-dir', default=DEFAULT_OUTPUT_DIR,
+                        help=f"directory for the results (default: {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument('-n', '--name', default=DEFAULT_NAME,
+                        help="output file name template; fields {stem}, {name}, {parent}, {index} "
+                             f"(default: {DEFAULT_NAME})")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('-f', '--force', action='store_true', help="render even if the result is up to date")
+    parser.add_argument('--base', default=BASE_IMAGE_PATH, help=f"shirt base image (default: {BASE_IMAGE_PATH})")
+    return parser.parse_args(argv)
 
-# Get dimensions
-base_width, base_height = base_image.size
-overlay_width, overlay_height = overlay_image.size
+def main(argv):
+    if not argv:
+        print("Usage: python script.py overlay_image.jpg")
+        return 1
 
-# Calculate position to center the overlay
-position = (
-    (base_width - overlay_width) // 2,
-    (base_height - overlay_height) // 2
-)
+    # One plain file and nothing else: the original single-image mode
+    if len(argv) == 1 and os.path.isfile(argv[0]):
+        _load_base(BASE_IMAGE_PATH)
+        compose(_base, argv[0], LEGACY_OUTPUT)
+        return 0
 
-# Paste the overlay image onto the base image
-base_image.paste(overlay_image, position, overlay_image.convert("RGBA"))
+    return batch(parse_args(argv))
 
-# Save the result
-base_image.save('result.jpg')
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
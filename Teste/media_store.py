@@ -0,0 +1,207 @@
+# media_store.py
+#
+# Quota-managed store for downloaded and rendered stickers (the stickers/
+# directory).
+#
+# Downloads are stored under the hash of their content, so names never
+# collide and a sticker that is sent twice is stored once. Derived files
+# (renders) are named from a key. Both are spread over 256 shard
+# subdirectories so no single directory grows large.
+#
+# Recency is kept in the file's mtime (touched on every hit), so it is shared
+# by every process using the store. sweep() removes least-recently-used files
+# until the store is back under LOW_WATER of its quota; start_background()
+# runs it periodically in a daemon thread.
+
+import hashlib
+import os
+import threading
+import time
+
+# ====================== Configuration ======================
+
+DOWNLOAD_DIR = os.path.join(os.getcwd(), 'stickers')
+DEFAULT_QUOTA_BYTES = 512 * 1024 * 1024
+LOW_WATER = 0.9  # Evict down to 90% of the quota
+SWEEP_INTERVAL = 60  # seconds
+# Files this young are never evicted; a worker may still be using them
+MIN_AGE_SECONDS = 120
+
+# ====================== Media Store ======================
+
+class MediaStore:
+    def __init__(self, root=DOWNLOAD_DIR, quota_bytes=DEFAULT_QUOTA_BYTES):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.total_bytes = 0
+        self.file_count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stop = False
+        os.makedirs(root, exist_ok=True)
+
+    # ---------- naming ----------
+
+    def _sharded(self, digest, name):
+        directory = os.path.join(self.root, digest[:2])
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def path_for(self, key, prefix, extension):
+        """
+        Path of a derived file (e.g. a render) identified by `key`.
+        Check it with lookup() and record it with commit() once written.
+        """
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self._sharded(digest, f"{prefix}_{digest[:24]}{extension}")
+
+    # ---------- reads and writes ----------
+
+    def put(self, data, prefix='sticker', extension='.png'):
+        """
+        Stores `data` under its content hash and returns the path.
+        Storing bytes that are already present only refreshes their recency.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._sharded(digest, f"{prefix}_{digest[:24]}{extension}")
+        if self.lookup(path):
+            return path
+
+        # Write then rename, so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._account(len(data))
+        return path
+
+    def lookup(self, path):
+        """
+        Returns True (and marks the file recently used) if path is in the store.
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def commit(self, path):
+        """Accounts for a file written directly to a path_for() path."""
+        try:
+            self._account(os.path.getsize(path))
+        except OSError:
+            pass
+
+    def _account(self, size):
+        with self._lock:
+            self.total_bytes += size
+            self.file_count += 1
+            over_quota = self.total_bytes > self.quota_bytes
+        if over_quota:
+            self._wake.set()
+
+    # ---------- eviction ----------
+
+    def _scan(self):
+        """
+        Every stored file: those in the shards, plus loose files at the top
+        level (stickers/ from before the store was sharded).
+        """
+        entries = []
+        for top in os.scandir(self.root):
+            children = os.scandir(top.path) if top.is_dir() else [top]
+            for entry in children:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def sweep(self):
+        """
+        Rescans the store (other processes write to it too) and evicts
+        least-recently-used files until it is under LOW_WATER of the quota.
+        Returns the number of files evicted.
+        """
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        target = self.quota_bytes * LOW_WATER
+        evicted = 0
+        evicted_bytes = 0
+        if total > self.quota_bytes:
+            cutoff = time.time() - MIN_AGE_SECONDS
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= target or mtime > cutoff:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+                evicted_bytes += size
+
+        with self._lock:
+            self.total_bytes = total
+            self.file_count = len(entries) - evicted
+            self.evicted_files += evicted
+            self.evicted_bytes += evicted_bytes
+        return evicted
+
+    def start_background(self, interval=SWEEP_INTERVAL):
+        """Sweeps every `interval` seconds, or right away when over quota."""
+        if self._thread is not None:
+            return
+        self._stop = False
+
+        def run():
+            while not self._stop:
+                try:
+                    evicted = self.sweep()
+                    if evicted:
+                        print(f"Media store: evicted {evicted} file(s). {self.describe()}")
+                except Exception as e:
+                    print(f"Media store sweep error: {e}")
+                self._wake.wait(interval)
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=run, name='media-store-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop_background(self):
+        self._stop = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # ---------- reporting ----------
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'files': self.file_count,
+                'bytes': self.total_bytes,
+                'quota_bytes': self.quota_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evicted_files': self.evicted_files,
+                'evicted_bytes': self.evicted_bytes,
+            }
+
+    def describe(self):
+        s = self.stats()
+        return (f"{s['files']} files, {s['bytes'] / 1024 / 1024:.1f} of "
+                f"{s['quota_bytes'] / 1024 / 1024:.0f} MB, hit rate {s['hit_rate']:.0%} "
+                f"({s['hits']}/{s['hits'] + s['misses']}), {s['evicted_files']} evicted")
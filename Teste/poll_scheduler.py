@@ -0,0 +1,150 @@
+# poll_scheduler.py
+#
+# Adaptive polling for the WhatsApp monitors.
+#
+# Instead of sleeping a fixed interval between checks, the monitors ask a
+# PollScheduler how long to wait. While chats are active the interval stays
+# at MIN_INTERVAL; every idle iteration multiplies it by BACKOFF, up to
+# MAX_INTERVAL. The wait itself happens inside the page: a MutationObserver
+# on the chat list and the open chat ends it as soon as the DOM changes, so
+# a new message is picked up right away even at the idle ceiling.
+#
+# The scheduler counts polls and measures wake-to-detect latency: the time
+# from the DOM change that woke the loop to the moment the monitor reports
+# the new message with detected().
+
+import time
+
+# ====================== Configuration ======================
+
+MIN_INTERVAL = 0.5  # seconds, while chats are active
+MAX_INTERVAL = 20  # seconds, idle ceiling; must stay under the script timeout (30 s)
+BACKOFF = 2.0
+
+# The chat list and the open conversation
+WATCH_SELECTORS = ['#pane-side', '#main']
+
+WAIT_FOR_CHANGE_SCRIPT = """
+    const selectors = arguments[0];
+    const timeoutMs = arguments[1];
+    const callback = arguments[arguments.length - 1];
+    const targets = selectors.map(s => document.querySelector(s)).filter(Boolean);
+    if (!targets.length) {
+        targets.push(document.body);
+    }
+    let done = false;
+    let timer = null;
+    const observer = new MutationObserver(() => finish(Date.now()));
+    function finish(changedAt) {
+        if (done) return;
+        done = true;
+        observer.disconnect();
+        clearTimeout(timer);
+        callback(changedAt);
+    }
+    targets.forEach(t => observer.observe(t, {childList: true, subtree: true}));
+    timer = setTimeout(() => finish(null), timeoutMs);
+"""
+
+# ====================== Poll Scheduler ======================
+
+class PollScheduler:
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, backoff=BACKOFF,
+                 selectors=WATCH_SELECTORS, log_interval=None, clock=time.monotonic):
+        """
+        log_interval: if set, wait() prints describe() that often (seconds),
+        for monitors without a periodic report of their own.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.selectors = selectors
+        self.log_interval = log_interval
+        self.clock = clock
+        self.interval = min_interval
+        self.polls = 0
+        self.change_wakes = 0
+        self._started = clock()
+        self._last_log = self._started
+        self._changed_at = None  # wall time of the DOM change that woke us
+        self._latency = [0, 0.0, 0.0]  # count, total, max
+
+    def active(self):
+        """Chats are active: poll at the minimum interval."""
+        self.interval = self.min_interval
+
+    def idle(self):
+        """Nothing happened this iteration: back off."""
+        self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def detected(self):
+        """
+        The monitor found a new message. Records the latency from the wake
+        that led to it and resets the interval.
+        """
+        if self._changed_at is not None:
+            latency = max(0.0, time.time() - self._changed_at)
+            self._latency[0] += 1
+            self._latency[1] += latency
+            self._latency[2] = max(self._latency[2], latency)
+            self._changed_at = None
+        self.active()
+
+    def wait(self, driver=None, limit=None):
+        """
+        Waits for the current interval (or `limit` seconds, if sooner).
+        With a driver, returns early when the watched part of the page
+        changes. Returns True if woken by a change.
+        """
+        timeout = self.interval if limit is None else max(0.0, min(self.interval, limit))
+        self.polls += 1
+        self._changed_at = None
+        self._maybe_log()
+
+        if driver is None or timeout <= 0:
+            time.sleep(timeout)
+            return False
+
+        started = self.clock()
+        try:
+            changed_at = driver.execute_async_script(
+                WAIT_FOR_CHANGE_SCRIPT, self.selectors, int(timeout * 1000))
+        except Exception:
+            # Page mid-reload or script timeout: sleep out the rest
+            time.sleep(max(0.0, timeout - (self.clock() - started)))
+            return False
+        if changed_at is None:
+            return False
+        self.change_wakes += 1
+        self._changed_at = changed_at / 1000
+        return True
+
+    # ---------- reporting ----------
+
+    def _maybe_log(self):
+        if self.log_interval is None:
+            return
+        now = self.clock()
+        if now - self._last_log >= self.log_interval:
+            print(f"Polling: {self.describe()}")
+            self._last_log = now
+
+    def stats(self):
+        elapsed = max(1e-9, self.clock() - self._started)
+        count, total, longest = self._latency
+        return {
+            'polls': self.polls,
+            'polls_per_minute': self.polls * 60 / elapsed,
+            'interval': self.interval,
+            'change_wakes': self.change_wakes,
+            'detections': count,
+            'mean_latency': total / count if count else 0.0,
+            'max_latency': longest,
+        }
+
+    def describe(self):
+        s = self.stats()
+        return (f"{s['polls_per_minute']:.1f} polls/min, interval {s['interval']:.1f}s, "
+                f"{s['change_wakes']} woken by changes, wake-to-detect avg "
+                f"{s['mean_latency'] * 1000:.0f} ms max {s['max_latency'] * 1000:.0f} ms "
+                f"({s['detections']} detections)")
@@ -0,0 +1,342 @@
+# render_service.py
+#
+# Usage: python render_service.py [port] [host]
+#
+# Local HTTP render service. Templates are loaded once at start-up and stay
+# decoded in memory; each request uploads an overlay and gets the encoded
+# sticker back.
+#
+#   POST /render    body: the overlay image (any format Pillow reads)
+#                   query: template, scale, dx, dy, preset, size, max_bytes
+#                   -> image/webp
+#                   size must be one the template is pre-scaled to (see its
+#                   "sizes" in templates/manifest.json). Templates with a
+#                   print area fit the overlay to it and reject scale.
+#                   422 if no quality gets the sticker under max_bytes
+#                   (by default WhatsApp's limit).
+#   GET  /templates -> {"default": ..., "templates": [...]}
+#   GET  /health    -> {"status": "ok", ...counters}
+#
+# Connections are kept alive (HTTP/1.1). At most RENDER_CONCURRENCY renders
+# run at once; a request that cannot start within QUEUE_TIMEOUT gets 503.
+# Results are cached by the hash of the upload plus its parameters, up to
+# RENDER_CACHE_BYTES, least recently used first out.
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# ====================== Configuration ======================
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+RENDER_CONCURRENCY = os.cpu_count() or 2
+QUEUE_TIMEOUT = 10  # seconds a request may wait for a render slot
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+RENDER_CACHE_BYTES = 64 * 1024 * 1024
+KEEPALIVE_TIMEOUT = 15  # seconds an idle connection is kept open
+STREAM_CHUNK = 64 * 1024
+
+# ====================== Render Cache ======================
+
+class RenderCache:
+    """LRU of encoded results, bounded by their total size in bytes."""
+    def __init__(self, max_bytes=RENDER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (data, quality, fits)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, data, quality, fits):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (data, quality, fits)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, (old, _, _) = self._entries.popitem(last=False)
+                self.total_bytes -= len(old)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+# ====================== Render Service ======================
+
+class RenderParams:
+    __slots__ = ('template', 'scale', 'offset', 'preset', 'size', 'max_bytes')
+
+    def __init__(self, query):
+        """Parses the query string. Raises ValueError on a bad value."""
+        from sticker_encode import DEFAULT_PRESET, PRESETS, STICKER_SIZE
+
+        def first(name, default=None):
+            return query.get(name, [default])[0]
+
+        self.template = first('template')
+        scale = first('scale')
+        self.scale = float(scale) if scale is not None else None  # None: the default
+        if self.scale is not None and not 0 < self.scale <= 4:
+            raise ValueError("scale must be in (0, 4]")
+        self.offset = (float(first('dx', 0)), float(first('dy', 0)))
+        if not all(-1 <= d <= 1 for d in self.offset):
+            raise ValueError("dx and dy must be in [-1, 1]")
+        self.preset = first('preset', DEFAULT_PRESET)
+        if self.preset not in PRESETS:
+            raise ValueError(f"preset must be one of {', '.join(PRESETS)}")
+        size = int(first('size', STICKER_SIZE[0]))
+        self.size = (size, size)
+        max_bytes = first('max_bytes')
+        self.max_bytes = int(max_bytes) if max_bytes is not None else None
+        if self.max_bytes is not None and self.max_bytes <= 0:
+            raise ValueError("max_bytes must be positive")
+
+    def cache_key(self, template_name, data):
+        digest = hashlib.sha256(data).hexdigest()
+        return (f"{digest}|{template_name}|{self.scale}|{self.offset[0]}|{self.offset[1]}|"
+                f"{self.preset}|{self.size[0]}|{self.max_bytes}")
+
+class Busy(Exception):
+    """No render slot became free within QUEUE_TIMEOUT."""
+
+class OverBudget(Exception):
+    """Even the lowest quality does not fit in the byte budget."""
+
+class RenderService:
+    def __init__(self, concurrency=RENDER_CONCURRENCY, cache_bytes=RENDER_CACHE_BYTES):
+        from shirt_templates import get_registry
+
+        # Decode and pre-scale every template now, not on the first request
+        self.registry = get_registry()
+        self.concurrency = concurrency
+        self.cache = RenderCache(cache_bytes)
+        self.rendered = 0
+        self.rejected = 0
+        self.render_seconds = 0.0
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+
+    def render(self, data, params):
+        """
+        Returns (webp bytes, quality, cache hit). Raises KeyError for an
+        unknown template, Busy when saturated, OverBudget when the sticker
+        cannot be made small enough, and ValueError (or Pillow's errors)
+        for a bad upload.
+        """
+        import io
+
+        from sticker_render import OVERLAY_SCALE, render_overlay
+
+        template = self.registry.get(params.template)
+        if params.scale is not None and template.print_area is not None:
+            raise ValueError(f"template '{template.name}' fits the overlay to its print area; "
+                             "scale does not apply")
+        # Only pre-scaled sizes: any other would add a rendition for good
+        if params.size not in template.sizes:
+            sizes = ', '.join(str(w) for w, h in template.sizes if w == h)
+            raise ValueError(f"size must be one of {sizes} for template '{template.name}'")
+        key = params.cache_key(template.name, data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            data, quality, fits = cached
+            if not fits:
+                raise OverBudget(f"smallest encoding is {len(data)} bytes, over the budget")
+            return data, quality, True
+
+        if not self._slots.acquire(timeout=QUEUE_TIMEOUT):
+            with self._lock:
+                self.rejected += 1
+            raise Busy()
+        try:
+            started = time.perf_counter()
+            scale = OVERLAY_SCALE if params.scale is None else params.scale
+            result = render_overlay(template, io.BytesIO(data), scale, params.preset,
+                                    params.max_bytes, params.size, params.offset)
+            elapsed = time.perf_counter() - started
+        finally:
+            self._slots.release()
+
+        # Over-budget results are cached too, so a retry is not another full search
+        quality = 'lossless' if result.lossless else result.quality
+        self.cache.put(key, result.data, quality, result.fits)
+        with self._lock:
+            self.rendered += 1
+            self.render_seconds += elapsed
+        if not result.fits:
+            raise OverBudget(f"smallest encoding is {len(result.data)} bytes, over the budget")
+        return result.data, quality, False
+
+    def stats(self):
+        with self._lock:
+            rendered = self.rendered
+            stats = {
+                'rendered': rendered,
+                'rejected': self.rejected,
+                'mean_render_ms': self.render_seconds / rendered * 1000 if rendered else 0.0,
+            }
+        stats['cache'] = self.cache.stats()
+        stats['concurrency'] = self.concurrency
+        return stats
+
+# ====================== HTTP ======================
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out as separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+    server_version = 'StickerRender/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self._send_json(200, dict(status='ok', **self.service.stats()))
+        elif path == '/templates':
+            registry = self.service.registry
+            self._send_json(200, {'default': registry.default, 'templates': registry.names()})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        from PIL import Image, UnidentifiedImageError
+
+        url = urlsplit(self.path)
+        length = self._content_length()
+        if length is None:
+            # The body can't be skipped without its length, so drop the connection
+            self.close_connection = True
+            self._send_json(400, {'error': 'bad Content-Length'})
+            return
+        if url.path != '/render':
+            if length > MAX_UPLOAD_BYTES:
+                self.close_connection = True  # not worth reading
+            else:
+                self._discard_body(length)
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        if length == 0:
+            self.close_connection = True
+            self._send_json(411, {'error': 'upload the overlay as the request body'})
+            return
+        if length > MAX_UPLOAD_BYTES:
+            self._send_json(413, {'error': f"upload larger than {MAX_UPLOAD_BYTES} bytes"})
+            self.close_connection = True
+            return
+        data = self.rfile.read(length)
+
+        try:
+            params = RenderParams(parse_qs(url.query))
+            image, quality, hit = self.service.render(data, params)
+        except KeyError as e:
+            self._send_json(404, {'error': e.args[0] if e.args else 'unknown template'})
+        except Busy:
+            self._send_json(503, {'error': 'busy'}, {'Retry-After': '1'})
+        except OverBudget as e:
+            self._send_json(422, {'error': str(e)})
+        except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+            self._send_json(415, {'error': str(e)})
+        except (ValueError, OSError) as e:
+            self._send_json(400, {'error': str(e)})
+        else:
+            self._send_bytes(200, image, 'image/webp', {
+                'X-Render-Cache': 'hit' if hit else 'miss',
+                'X-Render-Quality': str(quality),
+            })
+
+    # ---------- helpers ----------
+
+    def _content_length(self):
+        """The request's Content-Length (0 if absent), or None if it is not valid."""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return None
+        return length if length >= 0 else None
+
+    def _discard_body(self, length):
+        while length > 0:
+            chunk = self.rfile.read(min(length, STREAM_CHUNK))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send_bytes(status, json.dumps(payload).encode('utf-8'), 'application/json', headers)
+
+    def _send_bytes(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        view = memoryview(body)
+        for start in range(0, len(view), STREAM_CHUNK):
+            self.wfile.write(view[start:start + STREAM_CHUNK])
+
+    def log_message(self, format, *args):
+        # Keep successful requests out of the console; load tests make thousands
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def log_error(self, format, *args):
+        super().log_message(format, *args)
+
+def make_server(port=DEFAULT_PORT, host=DEFAULT_HOST, service=None, verbose=False):
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = service or RenderService()
+    server.verbose = verbose
+    return server
+
+# ====================== Main ======================
+
+def main(argv):
+    port = int(argv[0]) if len(argv) > 0 else DEFAULT_PORT
+    host = argv[1] if len(argv) > 1 else DEFAULT_HOST
+    server = make_server(port, host, verbose=True)
+    registry = server.service.registry
+    print(f"Render service on http://{host}:{server.server_port}/ "
+          f"({len(registry.names())} template(s), {server.service.concurrency} render slot(s))")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
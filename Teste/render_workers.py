@@ -0,0 +1,154 @@
+# render_workers.py
+#
+# Render worker pool for whatsapp_monitor.py, with shared-memory handoff.
+#
+# The monitor captures a sticker's bytes once, when it sees the message,
+# copies them into a multiprocessing.shared_memory block and hands the
+# worker only a ShmHandle (block name and length), not the bytes through
+# the executor's pipe. The worker copies the bytes out of the block, so it
+# can close its handle before the slow decode and render, and returns the
+# encoded sticker as the job's result; it is within the sticker budget, so
+# pickling it back is cheap. Nothing touches the disk until the monitor
+# writes the finished sticker for the browser's file input.
+#
+# Ownership: the monitor creates the input blocks, keeps them open while
+# the job runs and unlinks them once it is done. Workers never create a
+# block: on Windows a block is gone as soon as its last handle is closed,
+# so one made in a worker would not outlive the call.
+#
+# If a worker dies, the pool is broken: its jobs fail, and the next submit
+# starts a new pool.
+
+import io
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+# ====================== Configuration ======================
+
+RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+ShmHandle = namedtuple('ShmHandle', 'name size')
+
+# ====================== Shared Memory ======================
+
+def share_bytes(data):
+    """
+    Copies data into a new shared memory block.
+    Returns (block, handle); the caller owns the block.
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block, ShmHandle(block.name, len(data))
+
+def read_shared(handle):
+    """Returns a copy of the bytes behind handle."""
+    block = shared_memory.SharedMemory(name=handle.name)
+    try:
+        return bytes(block.buf[:handle.size])
+    finally:
+        block.close()
+
+def release(block):
+    block.close()
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+# ====================== Worker Side ======================
+
+def _warm_worker():
+    # Decode and pre-scale the templates once per worker
+    from shirt_templates import get_registry
+    get_registry()
+
+def _render(handle, template_name, preset):
+    from shirt_templates import get_template
+    from sticker_encode import describe
+    from sticker_render import render_overlay
+
+    overlay = io.BytesIO(read_shared(handle))
+    result = render_overlay(get_template(template_name), overlay, preset=preset)
+    return result.data, describe(result)
+
+# ====================== Monitor Side ======================
+
+class RenderJob:
+    __slots__ = ('sender', 'future', 'block', 'submitted_at')
+
+    def __init__(self, sender, future, block, submitted_at):
+        self.sender = sender
+        self.future = future
+        self.block = block
+        self.submitted_at = submitted_at
+
+class RenderPool:
+    def __init__(self, workers=RENDER_WORKERS, template=None, preset=None):
+        from sticker_encode import DEFAULT_PRESET
+
+        self.workers = workers
+        self.template = template
+        self.preset = preset or DEFAULT_PRESET
+        self.restarts = 0
+        self._executor = self._start()
+        self._jobs = []
+
+    def _start(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+
+    def _restart(self):
+        """Replaces a broken pool. Jobs still on the old one fail when collected."""
+        print("A render worker died; starting a new pool.")
+        self._executor.shutdown(wait=False)
+        self._executor = self._start()
+        self.restarts += 1
+
+    def submit(self, sender, data):
+        """Queues sticker bytes for rendering."""
+        block, handle = share_bytes(data)
+        try:
+            try:
+                future = self._executor.submit(_render, handle, self.template, self.preset)
+            except BrokenProcessPool:
+                self._restart()
+                future = self._executor.submit(_render, handle, self.template, self.preset)
+        except Exception:
+            release(block)
+            raise
+        self._jobs.append(RenderJob(sender, future, block, time.monotonic()))
+
+    def pending(self):
+        return len(self._jobs)
+
+    def collect(self):
+        """
+        Returns [(sender, sticker bytes or None)] for every finished job.
+        Never blocks.
+        """
+        finished = []
+        running = []
+        for job in self._jobs:
+            if not job.future.done():
+                running.append(job)
+                continue
+            release(job.block)
+            try:
+                data, summary = job.future.result()
+                elapsed = time.monotonic() - job.submitted_at
+                print(f"Rendered sticker for {job.sender} in {elapsed:.1f}s ({summary})")
+                finished.append((job.sender, data))
+            except Exception as e:
+                print(f"Render failed for {job.sender}: {e}")
+                finished.append((job.sender, None))
+        self._jobs = running
+        return finished
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for job in self._jobs:
+            release(job.block)
+        self._jobs = []
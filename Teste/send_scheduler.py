@@ -0,0 +1,195 @@
+# send_scheduler.py
+#
+# Priority scheduler in front of the WhatsApp send path.
+#
+# Jobs are queued per priority class (control commands, then text replies,
+# then sticker deliveries) and, inside a class, per sender. Classes are
+# served strictly in priority order; senders inside a class are served
+# round-robin, so one sender spamming stickers only delays their own queue.
+#
+# Every job that sends something must take a token from the sender's bucket
+# and from the global bucket, which keeps us under WhatsApp's anti-spam
+# limits. Control jobs only change local state and are not rate limited.
+#
+# The WebDriver is not thread-safe, so nothing runs in the background: the
+# monitor loop calls run_ready() between its browser reads.
+
+import time
+from collections import OrderedDict, deque
+
+# ====================== Configuration ======================
+
+CONTROL = 0
+TEXT = 1
+STICKER = 2
+PRIORITY_NAMES = {CONTROL: 'control', TEXT: 'text', STICKER: 'sticker'}
+
+SENDER_RATE = 1 / 3  # tokens per second: one message every 3 s per sender
+SENDER_BURST = 3
+GLOBAL_RATE = 20 / 60  # 20 messages per minute overall
+GLOBAL_BURST = 5
+
+# ====================== Token Bucket ======================
+
+class TokenBucket:
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.tokens >= 1
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def wait_time(self, now):
+        """Seconds until a token is available."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+# ====================== Scheduler ======================
+
+class Job:
+    __slots__ = ('sender', 'priority', 'action', 'label', 'sends', 'queued_at')
+
+    def __init__(self, sender, priority, action, label, sends, queued_at):
+        self.sender = sender
+        self.priority = priority
+        self.action = action
+        self.label = label
+        self.sends = sends
+        self.queued_at = queued_at
+
+class SendScheduler:
+    def __init__(self, sender_rate=SENDER_RATE, sender_burst=SENDER_BURST,
+                 global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, clock=time.monotonic):
+        self.clock = clock
+        self.sender_rate = sender_rate
+        self.sender_burst = sender_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock())
+        self._sender_buckets = {}
+        # One OrderedDict per class: sender -> deque of jobs, in round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self._waits = {priority: [0, 0.0, 0.0] for priority in PRIORITY_NAMES}  # count, total, max
+
+    def submit(self, sender, priority, action, label='', sends=True):
+        """
+        Queues action() for sender. sends=False marks jobs that only change
+        local state; they skip the rate limits.
+        """
+        job = Job(sender, priority, action, label, sends, self.clock())
+        queue = self._queues[priority]
+        if sender not in queue:
+            queue[sender] = deque()
+        queue[sender].append(job)
+
+    def pending(self, priority=None):
+        priorities = [priority] if priority is not None else list(self._queues)
+        return sum(len(jobs) for p in priorities for jobs in self._queues[p].values())
+
+    def run_ready(self, max_jobs=None):
+        """
+        Runs every job that its priority and the rate limits allow right now.
+        Returns the number of jobs run.
+        """
+        ran = 0
+        while max_jobs is None or ran < max_jobs:
+            now = self.clock()
+            job = self._pick(now)
+            if job is None:
+                break
+            if job.sends:
+                self.global_bucket.consume(now)
+                self._bucket(job.sender, now).consume(now)
+            self._record_wait(job.priority, now - job.queued_at)
+            try:
+                job.action()
+            except Exception as e:
+                print(f"Scheduled {PRIORITY_NAMES[job.priority]} job for {job.sender} failed: {e}")
+            ran += 1
+        self._prune(self.clock())
+        return ran
+
+    def next_ready_in(self):
+        """
+        Seconds until the next queued job could run (0 if one can run now,
+        None if nothing is queued).
+        """
+        now = self.clock()
+        best = None
+        for queue in self._queues.values():
+            for sender, jobs in queue.items():
+                if not jobs[0].sends:
+                    return 0.0
+                wait = max(self.global_bucket.wait_time(now), self._bucket(sender, now).wait_time(now))
+                best = wait if best is None else min(best, wait)
+        return best
+
+    def _bucket(self, sender, now):
+        bucket = self._sender_buckets.get(sender)
+        if bucket is None:
+            bucket = self._sender_buckets[sender] = TokenBucket(self.sender_rate, self.sender_burst, now)
+        return bucket
+
+    def _pick(self, now):
+        global_ok = self.global_bucket.available(now)
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            for sender, jobs in queue.items():
+                job = jobs[0]
+                if job.sends and not (global_ok and self._bucket(sender, now).available(now)):
+                    continue
+                jobs.popleft()
+                # Move the sender to the back of the round-robin order
+                del queue[sender]
+                if jobs:
+                    queue[sender] = jobs
+                return job
+        return None
+
+    def _prune(self, now):
+        # Drop buckets of senders with nothing queued once they have refilled
+        queued = set()
+        for queue in self._queues.values():
+            queued.update(queue)
+        for sender in [s for s, b in self._sender_buckets.items() if s not in queued and b.is_full(now)]:
+            del self._sender_buckets[sender]
+
+    # ---------- reporting ----------
+
+    def _record_wait(self, priority, wait):
+        stats = self._waits[priority]
+        stats[0] += 1
+        stats[1] += wait
+        stats[2] = max(stats[2], wait)
+
+    def wait_stats(self):
+        """Per class: jobs run, mean and max queue wait in seconds, jobs still queued."""
+        result = {}
+        for priority, (count, total, longest) in self._waits.items():
+            result[PRIORITY_NAMES[priority]] = {
+                'count': count,
+                'mean_wait': total / count if count else 0.0,
+                'max_wait': longest,
+                'pending': self.pending(priority),
+            }
+        return result
+
+    def describe(self):
+        parts = []
+        for name, s in self.wait_stats().items():
+            parts.append(f"{name} {s['count']} run, wait avg {s['mean_wait']:.1f}s "
+                         f"max {s['max_wait']:.1f}s, {s['pending']} queued")
+        return '; '.join(parts)
@@ -0,0 +1,272 @@
+# session_table.py
+#
+# Per-sender state for whatsapp_monitor.py in one compact table.
+#
+# Each sender gets a slot in a set of parallel arrays instead of entries in
+# several dicts and sets:
+#
+#   flags      1 byte   PROCESSED (sticker handled, waiting for "0"),
+#                       WATCHED (chat checked after its badge is gone),
+#                       HAS_CURSOR (cursor holds a message)
+#   triggers   8 bytes  bit i set = trigger rule i already answered
+#   activity   8 bytes  last new message (monotonic seconds)
+#   checked    8 bytes  last time the watched chat was read
+#   cursor     8 bytes  hash of the last message handled
+#
+# Watched chats follow the hot/cold rules the chat tracker used: checked on
+# every iteration for HOT_SECONDS after activity, every COLD_CHECK_SECONDS
+# after that, and unwatched after IDLE_SECONDS. An unwatched chat keeps its
+# cursor, so reading it again later only reports messages that are really
+# new. A sender with no activity for SESSION_TTL is dropped entirely and
+# their slot is reused, so the table is bounded by recent senders, not by
+# everyone ever seen.
+
+import time
+from array import array
+
+# ====================== Configuration ======================
+
+HOT_SECONDS = 120
+COLD_CHECK_SECONDS = 60
+IDLE_SECONDS = 900  # Stop watching a chat after this long without activity
+SESSION_TTL = 24 * 3600  # Forget a sender after this long without activity
+EXPIRE_INTERVAL = 60  # seconds between expiry scans
+
+MAX_TRIGGER_RULES = 64  # bits in the trigger bitset
+
+PROCESSED = 0x01
+WATCHED = 0x02
+HAS_CURSOR = 0x04
+
+HOT = 'hot'
+COLD = 'cold'
+
+# ====================== Session Table ======================
+
+class SessionTable:
+    def __init__(self, hot_seconds=HOT_SECONDS, cold_check_seconds=COLD_CHECK_SECONDS,
+                 idle_seconds=IDLE_SECONDS, session_ttl=SESSION_TTL, clock=time.monotonic):
+        self.hot_seconds = hot_seconds
+        self.cold_check_seconds = cold_check_seconds
+        self.idle_seconds = idle_seconds
+        self.session_ttl = session_ttl
+        self.clock = clock
+        self.evicted = 0  # chats unwatched for being idle
+        self.expired = 0  # sessions dropped after SESSION_TTL
+        self._slots = {}  # sender -> slot
+        self._senders = []  # slot -> sender, None when free
+        self._free = []
+        self._watched = set()  # slots with WATCHED set
+        self._flags = array('B')
+        self._triggers = array('Q')
+        self._activity = array('d')
+        self._checked = array('d')
+        self._cursor = array('q')
+        self._last_expire = clock()
+
+    def __contains__(self, sender):
+        return self._slot(sender) is not None
+
+    def __len__(self):
+        return len(self._slots)
+
+    # ---------- slots ----------
+
+    def _slot(self, sender):
+        """Returns the sender's slot, or None (expiring it if its TTL ran out)."""
+        slot = self._slots.get(sender)
+        if slot is not None and self.clock() - self._activity[slot] >= self.session_ttl:
+            self._release(slot)
+            self.expired += 1
+            return None
+        return slot
+
+    def _ensure(self, sender):
+        slot = self._slot(sender)
+        if slot is not None:
+            return slot
+        now = self.clock()
+        if self._free:
+            slot = self._free.pop()
+            self._senders[slot] = sender
+            self._flags[slot] = 0
+            self._triggers[slot] = 0
+            self._activity[slot] = now
+            self._checked[slot] = now
+            self._cursor[slot] = 0
+        else:
+            slot = len(self._senders)
+            self._senders.append(sender)
+            self._flags.append(0)
+            self._triggers.append(0)
+            self._activity.append(now)
+            self._checked.append(now)
+            self._cursor.append(0)
+        self._slots[sender] = slot
+        return slot
+
+    def _release(self, slot):
+        del self._slots[self._senders[slot]]
+        self._senders[slot] = None
+        self._watched.discard(slot)
+        self._free.append(slot)
+
+    # ---------- sticker state ----------
+
+    def is_processed(self, sender):
+        slot = self._slot(sender)
+        return slot is not None and bool(self._flags[slot] & PROCESSED)
+
+    def set_processed(self, sender, processed=True):
+        if processed:
+            slot = self._ensure(sender)
+            self._flags[slot] |= PROCESSED
+            self._activity[slot] = self.clock()
+        else:
+            slot = self._slot(sender)
+            if slot is not None:
+                self._flags[slot] &= ~PROCESSED & 0xFF
+
+    # ---------- trigger replies ----------
+
+    def has_responded(self, sender, rule):
+        slot = self._slot(sender)
+        return slot is not None and bool(self._triggers[slot] >> rule & 1)
+
+    def mark_responded(self, sender, rule):
+        if not 0 <= rule < MAX_TRIGGER_RULES:
+            raise ValueError(f"Trigger rule id must be below {MAX_TRIGGER_RULES}, got {rule}")
+        slot = self._ensure(sender)
+        self._triggers[slot] |= 1 << rule
+        self._activity[slot] = self.clock()
+
+    def clear_responded(self, sender):
+        slot = self._slot(sender)
+        if slot is not None:
+            self._triggers[slot] = 0
+
+    # ---------- watched chats ----------
+
+    def touch(self, sender):
+        """Records activity in the sender's chat and starts watching it."""
+        slot = self._ensure(sender)
+        self._flags[slot] |= WATCHED
+        self._activity[slot] = self.clock()
+        self._watched.add(slot)
+
+    def advance(self, sender, cursor):
+        """
+        Moves the sender's cursor to the latest message read from their chat.
+        Returns True if it is a message that was not handled yet; the chat
+        is then watched again if it was not.
+        """
+        slot = self._slot(sender)
+        now = self.clock()
+        marker = hash(cursor)
+        if slot is not None and self._flags[slot] & HAS_CURSOR and self._cursor[slot] == marker:
+            self._checked[slot] = now
+            return False
+        self.touch(sender)
+        slot = self._slots[sender]
+        self._checked[slot] = now
+        self._cursor[slot] = marker
+        self._flags[slot] |= HAS_CURSOR
+        return True
+
+    def set_cursor(self, sender, cursor):
+        """
+        Records the latest message in the sender's chat without counting it
+        as activity: the chat is not watched and the sender's TTL is not
+        renewed.
+        """
+        slot = self._ensure(sender)
+        self._cursor[slot] = hash(cursor)
+        self._flags[slot] |= HAS_CURSOR
+
+    def mark_checked(self, sender):
+        slot = self._slot(sender)
+        if slot is not None:
+            self._checked[slot] = self.clock()
+
+    def unwatch(self, sender):
+        """Stops watching the sender's chat; their sticker state and cursor are kept."""
+        slot = self._slot(sender)
+        if slot is not None:
+            self._flags[slot] &= ~WATCHED & 0xFF
+            self._watched.discard(slot)
+
+    def watching(self, sender):
+        slot = self._slot(sender)
+        return slot is not None and bool(self._flags[slot] & WATCHED)
+
+    def tier(self, sender):
+        slot = self._slot(sender)
+        if slot is None or not self._flags[slot] & WATCHED:
+            return None
+        return HOT if self.clock() - self._activity[slot] < self.hot_seconds else COLD
+
+    def evict_idle(self):
+        """Unwatches chats idle for IDLE_SECONDS. Returns their senders."""
+        now = self.clock()
+        idle = [slot for slot in self._watched if now - self._activity[slot] >= self.idle_seconds]
+        senders = []
+        for slot in idle:
+            self._flags[slot] &= ~WATCHED & 0xFF
+            self._watched.discard(slot)
+            senders.append(self._senders[slot])
+        self.evicted += len(idle)
+        return senders
+
+    def due(self):
+        """
+        Chats to check this iteration: every hot chat, plus cold chats not
+        checked for COLD_CHECK_SECONDS. Idle chats are unwatched and expired
+        sessions dropped first. Most recently active first.
+        """
+        self.evict_idle()
+        self.expire()
+        now = self.clock()
+        due = []
+        for slot in self._watched:
+            activity = self._activity[slot]
+            if now - activity < self.hot_seconds or now - self._checked[slot] >= self.cold_check_seconds:
+                due.append((activity, self._senders[slot]))
+        due.sort(reverse=True)
+        return [sender for _, sender in due]
+
+    # ---------- expiry ----------
+
+    def expire(self, force=False):
+        """
+        Drops sessions idle for SESSION_TTL. Scans at most every
+        EXPIRE_INTERVAL seconds unless forced. Returns the number dropped.
+        """
+        now = self.clock()
+        if not force and now - self._last_expire < EXPIRE_INTERVAL:
+            return 0
+        self._last_expire = now
+        cutoff = now - self.session_ttl
+        activity = self._activity
+        stale = [slot for slot, sender in enumerate(self._senders)
+                 if sender is not None and activity[slot] <= cutoff]
+        for slot in stale:
+            self._release(slot)
+        self.expired += len(stale)
+        return len(stale)
+
+    # ---------- reporting ----------
+
+    def hot_count(self):
+        now = self.clock()
+        return sum(1 for slot in self._watched if now - self._activity[slot] < self.hot_seconds)
+
+    def stats(self):
+        hot = self.hot_count()
+        return {
+            'sessions': len(self._slots),
+            'processed': sum(1 for slot in self._slots.values() if self._flags[slot] & PROCESSED),
+            'hot': hot,
+            'cold': len(self._watched) - hot,
+            'evicted': self.evicted,
+            'expired': self.expired,
+        }
@@ -0,0 +1,249 @@
+# shirt_templates.py
+#
+# Registry of shirt templates (colours and cuts) used by the renderers.
+#
+# Templates live in TEMPLATES_DIR next to a manifest.json:
+#
+#   {
+#     "default": "basica",
+#     "templates": [
+#       {
+#         "name": "basica",
+#         "file": "camisetabasica.jpg",
+#         "print_area": [430, 420, 930, 1000],
+#         "mask": "basica_mask.png",
+#         "sizes": [[512, 512]]
+#       }
+#     ]
+#   }
+#
+# print_area is a (left, top, right, bottom) box in the template's own
+# pixels; the overlay is fitted inside it. mask is an optional greyscale
+# image the size of the template (white = printable) that clips the overlay.
+# sizes lists the output sizes the template is pre-scaled to; the sticker
+# size is always included. Without a manifest, the registry serves the
+# legacy camisetabasica.jpg with the old centered 50% placement.
+#
+# Every rendition (full resolution and each pre-scaled size) is decoded once
+# and written to CACHE_DIR as raw RGBA. Renditions of at least
+# MMAP_MIN_PIXELS are then memory-mapped from that file instead of being held
+# on the heap, so worker processes share one copy through the page cache.
+
+import json
+import mmap
+import os
+import threading
+
+from PIL import Image
+
+from sticker_encode import STICKER_SIZE
+
+# ====================== Configuration ======================
+
+TEMPLATES_DIR = os.path.join(os.getcwd(), 'templates')
+MANIFEST_NAME = 'manifest.json'
+CACHE_DIR = os.path.join(os.getcwd(), 'template_cache')
+LEGACY_BASE_IMAGE_PATH = os.path.join(os.getcwd(), 'camisetabasica.jpg')
+LEGACY_TEMPLATE_NAME = 'camisetabasica.jpg'
+MMAP_MIN_PIXELS = 1_000_000
+
+# ====================== Raw RGBA Cache ======================
+
+def _raw_path(name, size):
+    return os.path.join(CACHE_DIR, f"{name}-{size[0]}x{size[1]}.rgba")
+
+def _raw_is_fresh(raw_path, source_path, size):
+    try:
+        raw = os.stat(raw_path)
+    except OSError:
+        return False
+    return raw.st_size == size[0] * size[1] * 4 and raw.st_mtime >= os.stat(source_path).st_mtime
+
+def _write_raw(raw_path, image):
+    os.makedirs(os.path.dirname(raw_path), exist_ok=True)
+    # Write then rename, so a worker never maps a half-written file; the
+    # name is per thread, since the render service builds from several
+    tmp_path = f"{raw_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(image.tobytes())
+    os.replace(tmp_path, raw_path)
+
+def _map_raw(raw_path, size):
+    with open(raw_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # Read-only image backed by the shared mapping; Pillow copies on write
+    return Image.frombuffer("RGBA", size, mapped, "raw", "RGBA", 0, 1)
+
+# ====================== Templates ======================
+
+class ShirtTemplate:
+    """
+    One shirt template with its print area, optional mask and pre-scaled
+    renditions. Images returned by base() are shared between callers and
+    must be copied before drawing on them.
+    """
+
+    def __init__(self, name, path, print_area=None, mask_path=None, sizes=()):
+        self.name = name
+        self.path = path
+        self.print_area = tuple(print_area) if print_area else None
+        self.mask_path = mask_path
+        self.sizes = [tuple(size) for size in sizes]
+        if STICKER_SIZE not in self.sizes:
+            self.sizes.append(STICKER_SIZE)
+
+        with Image.open(path) as source:
+            self.full_size = source.size  # Header only, no decode
+
+        self._masks = {}  # size -> L image
+        self._renditions = {}  # size -> (image, factor, offset)
+
+    def preload(self):
+        """Decodes and pre-scales every configured size up front."""
+        for size in self.sizes:
+            self._rendition(size)
+        return self
+
+    def base(self, size=None):
+        """
+        Returns (image, factor): the template fitted into an exact `size`
+        canvas (full resolution when size is None) and the scale factor.
+        """
+        image, factor, _ = self._rendition(size)
+        return image, factor
+
+    def print_area_at(self, size=None):
+        """The print area box in the coordinates of base(size), or None."""
+        if self.print_area is None:
+            return None
+        _, factor, (dx, dy) = self._rendition(size)
+        left, top, right, bottom = self.print_area
+        return (
+            int(left * factor) + dx, int(top * factor) + dy,
+            int(right * factor) + dx, int(bottom * factor) + dy,
+        )
+
+    def mask_at(self, size=None):
+        """The greyscale mask in the coordinates of base(size), or None."""
+        if self.mask_path is None:
+            return None
+        key = size or self.full_size
+        if key not in self._masks:
+            with Image.open(self.mask_path) as mask:
+                mask = mask.convert("L").resize(self.full_size)
+            image, factor, offset = self._rendition(size)
+            if factor != 1 or image.size != self.full_size:
+                fitted = mask.resize(_scaled(self.full_size, factor), Image.LANCZOS)
+                mask = Image.new("L", image.size, 0)
+                mask.paste(fitted, offset)
+            self._masks[key] = mask
+        return self._masks[key]
+
+    def _decode_full(self):
+        with Image.open(self.path) as source:
+            return source.convert("RGBA")
+
+    def _rendition(self, size):
+        key = size or self.full_size
+        if key in self._renditions:
+            return self._renditions[key]
+
+        if size is None or size == self.full_size:
+            factor, offset = 1.0, (0, 0)
+            build = self._decode_full
+        else:
+            factor = min(size[0] / self.full_size[0], size[1] / self.full_size[1])
+            fitted_size = _scaled(self.full_size, factor)
+            offset = ((size[0] - fitted_size[0]) // 2, (size[1] - fitted_size[1]) // 2)
+            build = lambda: self._fit(size, factor, offset)
+
+        image = self._load_cached(key, build)
+        self._renditions[key] = (image, factor, offset)
+        return self._renditions[key]
+
+    def _fit(self, size, factor, offset):
+        full_image, _, _ = self._rendition(None)
+        fitted = full_image.resize(_scaled(self.full_size, factor), Image.LANCZOS)
+        if fitted.size == size:
+            return fitted
+        canvas = Image.new("RGBA", size, (0, 0, 0, 0))
+        canvas.paste(fitted, offset)
+        return canvas
+
+    def _load_cached(self, size, build):
+        raw_path = _raw_path(self.name, size)
+        if _raw_is_fresh(raw_path, self.path, size):
+            if size[0] * size[1] >= MMAP_MIN_PIXELS:
+                return _map_raw(raw_path, size)
+            with open(raw_path, 'rb') as f:
+                return Image.frombytes("RGBA", size, f.read())
+
+        image = build()
+        try:
+            _write_raw(raw_path, image)
+        except OSError as e:
+            print(f"Failed to cache template '{self.name}' at {size}: {e}")
+            return image
+        if size[0] * size[1] >= MMAP_MIN_PIXELS:
+            # Drop the heap copy in favour of the shared mapping
+            return _map_raw(raw_path, size)
+        return image
+
+def _scaled(size, factor):
+    return (max(1, int(size[0] * factor)), max(1, int(size[1] * factor)))
+
+# ====================== Registry ======================
+
+class TemplateRegistry:
+    def __init__(self, directory=TEMPLATES_DIR):
+        self.directory = directory
+        self.templates = {}
+        self.default = None
+
+    def load(self, preload=True):
+        manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as file:
+                manifest = json.load(file)
+            for entry in manifest.get('templates', []):
+                mask = entry.get('mask')
+                template = ShirtTemplate(
+                    entry['name'],
+                    os.path.join(self.directory, entry['file']),
+                    print_area=entry.get('print_area'),
+                    mask_path=os.path.join(self.directory, mask) if mask else None,
+                    sizes=entry.get('sizes', ()),
+                )
+                self.templates[template.name] = template
+            self.default = manifest.get('default') or next(iter(self.templates), None)
+        elif os.path.exists(LEGACY_BASE_IMAGE_PATH):
+            template = ShirtTemplate(LEGACY_TEMPLATE_NAME, LEGACY_BASE_IMAGE_PATH)
+            self.templates[template.name] = template
+            self.default = template.name
+
+        if preload:
+            for template in self.templates.values():
+                template.preload()
+        return self
+
+    def get(self, name=None):
+        """Returns the named template (or the default). Raises KeyError if unknown."""
+        name = name or self.default
+        if name not in self.templates:
+            raise KeyError(f"Unknown shirt template '{name}'")
+        return self.templates[name]
+
+    def names(self):
+        return sorted(self.templates)
+
+_registry = None
+
+def get_registry():
+    """The process-wide registry, loaded on first use."""
+    global _registry
+    if _registry is None:
+        _registry = TemplateRegistry().load()
+    return _registry
+
+def get_template(name=None):
+    return get_registry().get(name)
@@ -0,0 +1,358 @@
+# soak_test.py
+#
+# Usage: python soak_test.py [hours] [speedup]
+#
+# Runs whatsapp_monitor's pipeline (sessions, blob prefetch, render workers,
+# media store, send scheduler, adaptive polling) for `hours` of simulated
+# time against a local stand-in for WhatsApp Web. Waits in the monitor run
+# `speedup` times faster than real time; rendering and everything else run
+# at full speed. Defaults: 2 hours at 30x (about 4 minutes).
+#
+# Every SAMPLE_INTERVAL simulated seconds it records the process RSS, the
+# memory traced by tracemalloc, open file descriptors and live child
+# processes. At the end it fits a line through the samples after the
+# warm-up and exits with status 1 if any of them grows faster than its
+# threshold per simulated hour or if a monitor pass raised (the first
+# traceback is printed), or 2 if the run was too short to tell. The top
+# tracemalloc growth sites since the warm-up are printed either way.
+#
+# psutil is used for RSS and descriptors when installed; otherwise /proc
+# (Linux only).
+
+import base64
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+from collections import deque
+
+# ====================== Configuration ======================
+
+DEFAULT_HOURS = 2
+DEFAULT_SPEEDUP = 30
+SAMPLE_INTERVAL = 300  # simulated seconds
+WARMUP_FRACTION = 0.25  # samples ignored when fitting slopes
+MIN_STEADY_SAMPLES = 6  # fewer than this after warm-up cannot show a trend
+SOAK_QUOTA_BYTES = 8 * 1024 * 1024  # small, so the sweeper has work to do
+
+SENDERS = 200
+MESSAGE_RATE = 0.05  # messages per simulated second, over all senders
+MESSAGE_MIX = [('sticker', 0.3), ('trigger', 0.3), ('reset', 0.25), ('other', 0.15)]
+LIVE_BLOBS = 256  # the page revokes older blob URLs
+
+# Maximum growth per simulated hour
+THRESHOLDS = {
+    'rss_mb': 8.0,
+    'traced_mb': 2.0,
+    'fds': 2.0,
+    'children': 0.5,
+}
+
+# ====================== Simulated Time ======================
+
+class AcceleratedTime:
+    """
+    Stand-in for the time module as the monitor sees it. sleep() only
+    really sleeps 1/speedup of the time asked and skips the rest; work
+    between sleeps takes real time.
+    """
+    def __init__(self, speedup):
+        self.speedup = speedup
+        self._started = time.monotonic()
+        self._skipped = 0.0
+        self._wall_offset = time.time() - self._started
+
+    def monotonic(self):
+        return time.monotonic() + self._skipped
+
+    def time(self):
+        return self.monotonic() + self._wall_offset
+
+    def sleep(self, seconds):
+        seconds = max(0.0, seconds)
+        time.sleep(seconds / self.speedup)
+        self._skipped += seconds - seconds / self.speedup
+
+    def elapsed(self):
+        return self.monotonic() - self._started
+
+# ====================== WhatsApp Stand-in ======================
+
+def make_sticker(rng):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGBA', (128, 128), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    color = tuple(rng.randrange(256) for _ in range(3)) + (255,)
+    draw.ellipse((rng.randrange(40), rng.randrange(40), 88 + rng.randrange(40), 88 + rng.randrange(40)), fill=color)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+class StandInWhatsApp:
+    """
+    Chat list and open chat of a fake WhatsApp Web. Only the latest message
+    of each chat is kept, as that is all the monitor reads.
+    """
+    def __init__(self, clock, triggers, senders=SENDERS, rate=MESSAGE_RATE, seed=1):
+        self.clock = clock
+        self.triggers = triggers
+        self.senders = [f"Soak {i:04d}" for i in range(senders)]
+        self.rate = rate
+        self.rng = random.Random(seed)
+        self.latest = {}  # sender -> (message id, msg_type, content)
+        self.unread = set()
+        self.active = None
+        self.blobs = {}
+        self._blob_order = deque()
+        self._blob_count = 0
+        self.received = 0
+        self.sent_texts = 0
+        self.sent_stickers = 0
+        self._next_arrival = clock.monotonic() + self.rng.expovariate(rate)
+
+    def next_arrival(self):
+        return self._next_arrival
+
+    def deliver_due(self):
+        """Delivers every message due by now. Returns True if any arrived."""
+        arrived = False
+        while self._next_arrival <= self.clock.monotonic():
+            self._deliver()
+            self._next_arrival += self.rng.expovariate(self.rate)
+            arrived = True
+        return arrived
+
+    def _deliver(self):
+        sender = self.rng.choice(self.senders)
+        kind = self.rng.choices([k for k, _ in MESSAGE_MIX], [w for _, w in MESSAGE_MIX])[0]
+        if kind == 'sticker':
+            self._blob_count += 1
+            url = f"blob:https://web.whatsapp.com/soak-{self._blob_count}"
+            self.blobs[url] = make_sticker(self.rng)
+            self._blob_order.append(url)
+            if len(self._blob_order) > LIVE_BLOBS:
+                self.blobs.pop(self._blob_order.popleft(), None)
+            message = ('sticker', url)
+        elif kind == 'trigger':
+            message = ('text', self.rng.choice(self.triggers))
+        elif kind == 'reset':
+            message = ('text', '0')
+        else:
+            message = ('text', f"message {self.received}")
+        self.latest[sender] = (f"soak-{self.received}",) + message
+        if sender != self.active:
+            self.unread.add(sender)
+        self.received += 1
+
+    # ---------- page helpers, in place of the monitor's XPath lookups ----------
+
+    def get_unread_chats(self):
+        self.deliver_due()
+        return list(self.unread)
+
+    def open_chat(self, sender):
+        self.active = sender
+        self.unread.discard(sender)
+        return True
+
+    def get_active_chat_name(self):
+        return self.active
+
+    def get_latest_message(self):
+        self.deliver_due()
+        return self.latest.get(self.active, (None, None, None))
+
+    def send_text_message(self, sender, message):
+        self.sent_texts += 1
+
+    def send_sticker(self, driver, sender, sticker_path):
+        if not os.path.exists(sticker_path):
+            raise FileNotFoundError(sticker_path)
+        self.sent_stickers += 1
+
+class StandInDriver:
+    """Answers the monitor's execute_async_script calls from the stand-in page."""
+    def __init__(self, page):
+        self.page = page
+
+    def execute_async_script(self, script, *args):
+        from blob_prefetch import FETCH_BLOBS_SCRIPT
+        from poll_scheduler import WAIT_FOR_CHANGE_SCRIPT
+
+        if script == FETCH_BLOBS_SCRIPT:
+            results = []
+            for url in args[0]:
+                data = self.page.blobs.get(url)
+                results.append(f"data:image/png;base64,{base64.b64encode(data).decode()}" if data else None)
+            return results
+        if script == WAIT_FOR_CHANGE_SCRIPT:
+            clock = self.page.clock
+            timeout = args[1] / 1000
+            arrival = self.page.next_arrival() - clock.monotonic()
+            if arrival <= timeout:
+                clock.sleep(arrival)
+                self.page.deliver_due()
+                return time.time() * 1000
+            clock.sleep(timeout)
+            return None
+        raise NotImplementedError("Stand-in driver does not run this script")
+
+# ====================== Sampling ======================
+
+def process_rss():
+    """Resident set size in bytes, or None if it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def open_descriptors():
+    """Open file descriptors (handles on Windows), or None."""
+    try:
+        import psutil
+        process = psutil.Process()
+        return process.num_handles() if os.name == 'nt' else process.num_fds()
+    except ImportError:
+        pass
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+def take_sample(clock):
+    rss = process_rss()
+    fds = open_descriptors()
+    return {
+        'hours': clock.elapsed() / 3600,
+        'rss_mb': rss / 1024 / 1024 if rss is not None else None,
+        'traced_mb': tracemalloc.get_traced_memory()[0] / 1024 / 1024,
+        'fds': fds,
+        'children': len(multiprocessing.active_children()),
+    }
+
+def slope(points):
+    """Least-squares slope of [(x, y)], or None with fewer than two points."""
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+def check_growth(samples):
+    """
+    Returns [(metric, slope per hour, threshold, ok)] over the post-warm-up
+    samples, or None if the run was too short to judge.
+    """
+    steady = samples[max(1, int(len(samples) * WARMUP_FRACTION)):]
+    if len(steady) < MIN_STEADY_SAMPLES:
+        return None
+    results = []
+    for metric, threshold in THRESHOLDS.items():
+        points = [(s['hours'], s[metric]) for s in steady if s[metric] is not None]
+        per_hour = slope(points)
+        results.append((metric, per_hour, threshold, per_hour is None or per_hour <= threshold))
+    return results
+
+# ====================== Soak Run ======================
+
+def soak(hours, speedup):
+    import whatsapp_monitor as monitor
+    from poll_scheduler import PollScheduler
+    from send_scheduler import SendScheduler
+    from session_table import SessionTable
+
+    clock = AcceleratedTime(speedup)
+    page = StandInWhatsApp(clock, monitor.trigger_messages)
+
+    # Point the monitor at simulated time and the stand-in page
+    monitor.time = clock
+    monitor.sessions = SessionTable(clock=clock.monotonic)
+    monitor.scheduler = SendScheduler(clock=clock.monotonic)
+    monitor.poller = PollScheduler(clock=clock.monotonic)
+    for name in ('get_unread_chats', 'open_chat', 'get_active_chat_name',
+                 'get_latest_message', 'send_text_message', 'send_sticker'):
+        setattr(monitor, name, getattr(page, name))
+
+    store_dir = tempfile.mkdtemp(prefix='soak_store_')
+    tracemalloc.start()
+    monitor.start_pipeline(StandInDriver(page), store_dir, SOAK_QUOTA_BYTES)
+    samples = []
+    baseline = None
+    next_sample = 0.0
+    errors = 0
+    print(f"Soak test: {hours} simulated hour(s) at {speedup}x, {SENDERS} senders, "
+          f"{MESSAGE_RATE * 60:.1f} messages/min")
+
+    try:
+        with open(os.devnull, 'w') as quiet:
+            while clock.elapsed() < hours * 3600:
+                if clock.elapsed() >= next_sample:
+                    sample = take_sample(clock)
+                    samples.append(sample)
+                    next_sample += SAMPLE_INTERVAL
+                    if baseline is None and sample['hours'] >= hours * WARMUP_FRACTION:
+                        baseline = tracemalloc.take_snapshot()
+                    rss = f"{sample['rss_mb']:.1f} MB" if sample['rss_mb'] is not None else 'n/a'
+                    print(f"[{sample['hours']:5.2f} h] rss {rss}, traced {sample['traced_mb']:.1f} MB, "
+                          f"fds {sample['fds']}, children {sample['children']}, "
+                          f"{page.received} received, {page.sent_texts} texts and "
+                          f"{page.sent_stickers} stickers sent, {monitor.render_pool.pending()} rendering")
+                with contextlib.redirect_stdout(quiet):
+                    try:
+                        monitor.monitor_pass()
+                    except Exception:
+                        if not errors:
+                            traceback.print_exc()
+                        errors += 1
+                    monitor.wait_for_next_pass()
+        final = tracemalloc.take_snapshot()
+    finally:
+        monitor.stop_pipeline()
+        tracemalloc.stop()
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    monitor.report()
+    if baseline is not None:
+        print("Top allocation growth since warm-up:")
+        for stat in final.compare_to(baseline, 'lineno')[:10]:
+            print(f"  {stat}")
+    if errors:
+        print(f"{errors} monitor pass(es) raised; the first traceback is above")
+
+    growth = check_growth(samples)
+    if growth is None:
+        print(f"Run too short to judge growth: need {MIN_STEADY_SAMPLES} samples after warm-up "
+              f"({SAMPLE_INTERVAL}s of simulated time apart)")
+        return 1 if errors else 2
+    failed = False
+    for metric, per_hour, threshold, ok in growth:
+        shown = f"{per_hour:+.2f}/h" if per_hour is not None else 'n/a'
+        print(f"{metric:<10} {shown:>10}  (limit {threshold:+.2f}/h)  {'ok' if ok else 'FAIL'}")
+        failed = failed or not ok
+    return 1 if failed or errors else 0
+
+def main(argv):
+    hours = float(argv[0]) if len(argv) > 0 else DEFAULT_HOURS
+    speedup = float(argv[1]) if len(argv) > 1 else DEFAULT_SPEEDUP
+    return soak(hours, speedup)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,197 @@
+# sticker_encode.py
+#
+# WebP encoding stage for rendered stickers.
+#
+# Presets trade encode speed against output quality. encode_to_budget()
+# finds the highest quality that fits WhatsApp's sticker size limit with a
+# binary search over a coarse quality ladder, and remembers the quality it
+# settled on per template in ENCODER_CACHE_PATH, so the next sticker on the
+# same template usually needs a single encode.
+
+import io
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+# ====================== Configuration ======================
+
+STICKER_SIZE = (512, 512)  # WhatsApp stickers are 512x512
+STATIC_LIMIT_BYTES = 100 * 1024
+ANIMATED_LIMIT_BYTES = 500 * 1024
+
+# method: 0 (fastest) .. 6 (smallest output)
+PRESETS = {
+    'fast': {'method': 0, 'quality': 75, 'lossless': False},
+    'balanced': {'method': 4, 'quality': 80, 'lossless': False},
+    'best': {'method': 6, 'quality': 90, 'lossless': False},
+    'lossless': {'method': 6, 'quality': 90, 'lossless': True},
+}
+DEFAULT_PRESET = 'balanced'
+
+MIN_QUALITY = 30
+QUALITY_STEP = 5
+
+ENCODER_CACHE_PATH = os.path.join(os.getcwd(), 'encoder_settings.json')
+
+EncodeResult = namedtuple('EncodeResult', 'data quality lossless method attempts seconds fits')
+
+# ====================== Encoders ======================
+
+def static_encoder(image):
+    """
+    Returns an encode function for a single composited image.
+    """
+    def encode(options):
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', **options)
+        return buffer.getvalue()
+    return encode
+
+def animated_encoder(make_frames, loop=0):
+    """
+    Returns an encode function for an animation.
+    make_frames() must return a fresh sticker_render.AnimatedComposite; frames
+    are streamed again on every attempt so memory stays bounded.
+    """
+    def encode(options):
+        frames = make_frames()
+        first = frames.first_frame()
+        buffer = io.BytesIO()
+        first.save(
+            buffer, 'WEBP',
+            save_all=True,
+            append_images=[frames],
+            duration=frames.durations,
+            loop=loop,
+            **options
+        )
+        return buffer.getvalue()
+    return encode
+
+# ====================== Settings Cache ======================
+
+def load_encoder_cache(file_path=None):
+    file_path = file_path or ENCODER_CACHE_PATH
+    if os.path.exists(file_path):
+        with open(file_path, 'r') as file:
+            try:
+                return json.load(file)
+            except json.JSONDecodeError:
+                return {}
+    return {}
+
+def save_encoder_cache(cache, file_path=None):
+    file_path = file_path or ENCODER_CACHE_PATH
+    # Write then rename, so a concurrent reader never sees a partial file
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(cache, file)
+    os.replace(tmp_path, file_path)
+
+_encoder_cache = None
+_encoder_cache_lock = threading.Lock()  # render_service.py encodes from several threads
+
+def _cache():
+    global _encoder_cache
+    if _encoder_cache is None:
+        _encoder_cache = load_encoder_cache()
+    return _encoder_cache
+
+def cache_key(template, animated, preset, max_bytes):
+    kind = 'animated' if animated else 'static'
+    return f"{template}|{kind}|{preset}|{max_bytes}"
+
+# ====================== Quality Search ======================
+
+def quality_ladder(top):
+    ladder = list(range(MIN_QUALITY, top + 1, QUALITY_STEP))
+    if not ladder or ladder[-1] != top:
+        ladder.append(top)
+    return ladder
+
+def search_quality(encode, options, max_bytes, start_quality=None):
+    """
+    Binary search for the highest quality whose output fits in max_bytes.
+    Starts at start_quality (or the preset's quality) so a good guess costs
+    one or two encodes. Returns (quality, data, attempts, fits); if nothing
+    fits, the smallest output is returned with fits=False.
+    """
+    ladder = quality_ladder(options['quality'])
+    lo, hi = 0, len(ladder) - 1
+    idx = hi
+    if start_quality is not None:
+        idx = max([i for i, q in enumerate(ladder) if q <= start_quality] or [0])
+
+    best = None
+    smallest = None
+    attempts = 0
+    while lo <= hi:
+        quality = ladder[idx]
+        data = encode(dict(options, quality=quality))
+        attempts += 1
+        if smallest is None or len(data) < len(smallest[1]):
+            smallest = (quality, data)
+        if len(data) <= max_bytes:
+            best = (quality, data)
+            lo = idx + 1
+            if attempts == 1 and start_quality is not None:
+                # The cached guess fits, but one hard sticker may have
+                # pushed it low: try the top next, then search in between
+                idx = hi
+                continue
+        else:
+            hi = idx - 1
+        idx = (lo + hi + 1) // 2
+
+    if best:
+        return best[0], best[1], attempts, True
+    return smallest[0], smallest[1], attempts, False
+
+def encode_to_budget(encode, max_bytes, preset=DEFAULT_PRESET, template=None, animated=False):
+    """
+    Encodes with the given preset, lowering quality until the output fits
+    in max_bytes. The chosen quality is cached per template.
+    """
+    options = dict(PRESETS[preset])
+    key = cache_key(template, animated, preset, max_bytes) if template else None
+    cached = _cache().get(key) if key else None
+    started = time.perf_counter()
+    attempts = 0
+
+    if options['lossless'] and not (cached and not cached.get('lossless')):
+        data = encode(options)
+        attempts += 1
+        if len(data) <= max_bytes:
+            if key:
+                _remember(key, {'lossless': True})
+            return EncodeResult(data, options['quality'], True, options['method'],
+                                attempts, time.perf_counter() - started, True)
+
+    # Lossy search (lossless presets fall back here when over budget)
+    options['lossless'] = False
+    start_quality = cached.get('quality') if cached else None
+    quality, data, search_attempts, fits = search_quality(encode, options, max_bytes, start_quality)
+    attempts += search_attempts
+    if key and fits:
+        _remember(key, {'lossless': False, 'quality': quality})
+    return EncodeResult(data, quality, False, options['method'],
+                        attempts, time.perf_counter() - started, fits)
+
+def _remember(key, settings):
+    with _encoder_cache_lock:
+        cache = _cache()
+        if cache.get(key) == settings:
+            return
+        cache[key] = settings
+        try:
+            save_encoder_cache(cache)
+        except OSError as e:
+            print(f"Failed to save encoder settings: {e}")
+
+def describe(result):
+    mode = 'lossless' if result.lossless else f"q{result.quality}"
+    note = '' if result.fits else ' (over budget)'
+    return (f"{len(result.data)} bytes, {mode}, method {result.method}, "
+            f"{result.attempts} attempt(s), {result.seconds * 1000:.1f} ms{note}")
@@ -1,147 +1,145 @@
 # sticker_handler.py
+#
+# Usage:
+#   python sticker_handler.py <sender_name> <sticker_url>
+#       Download the sticker through the shared Chrome session, render it onto
+#       the shirt and send it back to the sender.
+#   python sticker_handler.py render <overlay_image> [output_image] [template]
+#       Render only. Never imports selenium or requests, so it starts fast.
+#
+# Heavy modules (selenium, requests, PIL) are imported inside the functions
+# that need them. Keep it that way: check_startup.py fails if any of them
+# shows up when the module is merely imported or the usage error is printed.
 
 import sys
 import os
 import time
 import base64
-import requests
-from PIL import Image  # Importing PIL for image processing
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
 # ====================== Configuration ======================
 
-if len(sys.argv) != 3:
-    print("Usage: python sticker_handler.py <sender_name> <sticker_url>")
-    sys.exit(1)
-
-sender_name = sys.argv[1]
-sticker_url = sys.argv[2]
-
 CHROMEDRIVER_PATH = r"./chromedriver.exe"  # Update if necessary
 DOWNLOAD_DIR = os.path.join(os.getcwd(), 'stickers')
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 USER_DATA_DIR = os.path.abspath("User_Data_Selenium")
 REMOTE_DEBUGGING_PORT = 9222  # Must match in whatsapp_monitor.py
 
-# Base image for overlay
-BASE_IMAGE_PATH = os.path.join(os.getcwd(), 'camisetabasica.jpg')
-if not os.path.exists(BASE_IMAGE_PATH):
-    print(f"Base image '{BASE_IMAGE_PATH}' not found. Please ensure it exists.")
-    sys.exit(1)
-
-# ====================== Setup Chrome Options ======================
-
-chrome_options = Options()
-chrome_options.add_experimental_option("debuggerAddress", f"127.0.0.1:{REMOTE_DEBUGGING_PORT}")
-chrome_options.add_argument(f"--user-data-dir={USER_DATA_DIR}")  # Ensure same user data
-chrome_options.add_argument("--profile-directory=Default")
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-infobars")
-chrome_options.add_argument("--disable-notifications")
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--window-size=1920,1080")
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--disable-dev-shm-usage")
-
-# Initialize WebDriver connected to existing Chrome instance
-service = ChromeService(executable_path=CHROMEDRIVER_PATH)
-try:
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-except Exception as e:
-    print(f"Failed to connect to Chrome instance: {e}")
-    sys.exit(1)
-
-# ====================== Helper Functions ======================
-
-def download_sticker(url, path):
+CHROME_ARGUMENTS = [
+    f"--user-data-dir={USER_DATA_DIR}",  # Ensure same user data
+    "--profile-directory=Default",
+    "--disable-extensions",
+    "--disable-infobars",
+    "--disable-notifications",
+    "--disable-popup-blocking",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--window-size=1920,1080",
+    "--headless",
+]
+
+USAGE = (
+    "Usage: python sticker_handler.py <sender_name> <sticker_url>\n"
+    "       python sticker_handler.py render <overlay_image> [output_image] [template]"
+)
+
+# ====================== WebDriver Setup ======================
+
+def build_chrome_options():
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_experimental_option("debuggerAddress", f"127.0.0.1:{REMOTE_DEBUGGING_PORT}")
+    for argument in CHROME_ARGUMENTS:
+        chrome_options.add_argument(argument)
+    return chrome_options
+
+def connect_driver():
+    """
+    Attaches a WebDriver to the Chrome instance started by whatsapp_monitor.py.
+    Returns None if the connection fails.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service as ChromeService
+
+    service = ChromeService(executable_path=CHROMEDRIVER_PATH)
     try:
-        if url.startswith('blob:'):
-            # Handle blob URLs by extracting base64 data via JavaScript
-            data_url = driver.execute_async_script("""
-                const blobUrl = arguments[0];
-                const callback = arguments[1];
-                fetch(blobUrl)
-                    .then(response => response.blob())
-                    .then(blob => {
-                        const reader = new FileReader();
-                        reader.onloadend = () => callback(reader.result);
-                        reader.readAsDataURL(blob);
-                    })
-                    .catch(() => callback(null));
-            """, url)
-            if data_url:
-                _, encoded = data_url.split(',', 1)
-                binary_data = base64.b64decode(encoded)
-                filename = f"sticker_{int(time.time())}.png"
-                with open(os.path.join(path, filename), 'wb') as f:
-                    f.write(binary_data)
-                print(f"Sticker downloaded: {filename}")
-                return os.path.join(path, filename)
-            else:
-                print("Failed to retrieve blob data.")
-                return None
-        else:
-            # Handle regular URLs
-            response = requests.get(url)
-            if response.status_code == 200:
-                parsed = requests.utils.urlparse(url)
-                filename = os.path.basename(parsed.path) or f"sticker_{int(time.time())}.png"
-                filename = f"{int(time.time())}_{filename}"
-                filepath = os.path.join(path, filename)
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
-                print(f"Sticker downloaded: {filename}")
-                return filepath
-            else:
-                print(f"Failed to download sticker. Status Code: {response.status_code}")
-                return None
+        return webdriver.Chrome(service=service, options=build_chrome_options())
     except Exception as e:
-        print(f"Download error: {e}")
+        print(f"Failed to connect to Chrome instance: {e}")
         return None
 
-def edit_sticker(base_image_path, overlay_image_path, output_image_path):
-    try:
-        # Open the base and overlay images
-        base_image = Image.open(base_image_path).convert("RGBA")
-        overlay_image = Image.open(overlay_image_path).convert("RGBA")
-
-        # Get dimensions
-        base_width, base_height = base_image.size
-        overlay_width, overlay_height = overlay_image.size
+# ====================== Helper Functions ======================
 
-        # Resize the overlay image to 80% of its original size
-        new_size = (int(overlay_width * 0.5), int(overlay_height * 0.5))
-        overlay_image = overlay_image.resize(new_size, Image.LANCZOS)
+def fetch_sticker_bytes(driver, url):
+    """
+    Returns the sticker's bytes, or None. Blob URLs are only valid in the
+    page that created them, so they are read through the browser.
+    """
+    if url.startswith('blob:'):
+        # Handle blob URLs by extracting base64 data via JavaScript
+        data_url = driver.execute_async_script("""
+            const blobUrl = arguments[0];
+            const callback = arguments[1];
+            fetch(blobUrl)
+                .then(response => response.blob())
+                .then(blob => {
+                    const reader = new FileReader();
+                    reader.onloadend = () => callback(reader.result);
+                    reader.readAsDataURL(blob);
+                })
+                .catch(() => callback(null));
+        """, url)
+        if data_url:
+            _, encoded = data_url.split(',', 1)
+            return base64.b64decode(encoded)
+        print("Failed to retrieve blob data.")
+        return None
+    else:
+        # Handle regular URLs
+        import requests
 
-        # Get new dimensions after resizing
-        overlay_width, overlay_height = overlay_image.size
+        response = requests.get(url)
+        if response.status_code == 200:
+            return response.content
+        print(f"Failed to download sticker. Status Code: {response.status_code}")
+        return None
 
-        # Calculate position to center the overlay
-        position = (
-            (base_width - overlay_width) // 2,
-            (base_height - overlay_height) // 2
-        )
+def download_sticker(driver, url, store):
+    """
+    Downloads the sticker into the media store and returns its path.
+    """
+    try:
+        binary_data = fetch_sticker_bytes(driver, url)
+        if binary_data is None:
+            return None
+        extension = '.png'
+        if not url.startswith('blob:'):
+            extension = os.path.splitext(url.split('?', 1)[0])[1] or extension
+        filepath = store.put(binary_data, 'sticker', extension)
+        print(f"Sticker downloaded: {os.path.basename(filepath)}")
+        return filepath
+    except Exception as e:
+        print(f"Download error: {e}")
+        return None
 
-        # Paste the overlay image onto the base image with transparency
-        base_image.paste(overlay_image, position, overlay_image)
+def edit_sticker(template, overlay_image_path, output_image_path):
+    from sticker_encode import describe
+    from sticker_render import render_sticker
 
-        # Save the result in WEBP format to ensure compatibility with WhatsApp stickers
-        base_image.save(output_image_path, 'WEBP')
-        print(f"Edited sticker saved as: {output_image_path}")
+    try:
+        # Overlay the sticker onto the shirt template (animated stickers keep their frames)
+        result = render_sticker(template, overlay_image_path, output_image_path)
+        print(f"Edited sticker saved as: {output_image_path} ({describe(result)})")
         return output_image_path
     except Exception as e:
         print(f"Image editing error: {e}")
         return None
 
-def send_sticker(sender, sticker_path):
+def send_sticker(driver, sender, sticker_path):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
     try:
         # Search for the sender's chat
         search_box = WebDriverWait(driver, 10).until(
@@ -199,25 +197,80 @@ def send_sticker(sender, sticker_path):
     except Exception as e:
         print(f"Send error: {e}")
 
-# ====================== Execution ======================
-
-print(f"Handling sticker from {sender_name}...")
+# ====================== Commands ======================
 
-# Step 1: Download the sticker
-downloaded_sticker_path = download_sticker(sticker_url, DOWNLOAD_DIR)
+def load_template(name=None):
+    from shirt_templates import get_template
 
-if downloaded_sticker_path:
-    # Step 2: Edit the sticker by overlaying it onto the base image
-    edited_sticker_path = os.path.join(DOWNLOAD_DIR, f"edited_{os.path.basename(downloaded_sticker_path)}")
-    result_sticker_path = edit_sticker(BASE_IMAGE_PATH, downloaded_sticker_path, edited_sticker_path)
+    try:
+        return get_template(name)
+    except KeyError as e:
+        print(f"{e.args[0]}. Please ensure the template or camisetabasica.jpg exists.")
+        return None
 
-    if result_sticker_path:
-        # Step 3: Send the edited sticker back to the sender
-        send_sticker(sender_name, result_sticker_path)
+def handle_sticker(sender_name, sticker_url):
+    from media_store import MediaStore
+
+    template = load_template()
+    if template is None:
+        return 1
+    store = MediaStore(DOWNLOAD_DIR)
+
+    # Initialize WebDriver connected to existing Chrome instance
+    driver = connect_driver()
+    if driver is None:
+        return 1
+
+    print(f"Handling sticker from {sender_name}...")
+
+    # Step 1: Download the sticker
+    downloaded_sticker_path = download_sticker(driver, sticker_url, store)
+    if not downloaded_sticker_path:
+        print("Sticker download failed. Cannot proceed with editing and sending.")
+        return 1
+
+    # Step 2: Edit the sticker by overlaying it onto the shirt template
+    # (the same sticker on the same template is only rendered once)
+    render_key = f"{os.path.basename(downloaded_sticker_path)}|{template.name}"
+    edited_sticker_path = store.path_for(render_key, 'edited', '.webp')
+    if store.lookup(edited_sticker_path):
+        print(f"Reusing edited sticker: {edited_sticker_path}")
+        result_sticker_path = edited_sticker_path
     else:
-        print("Failed to edit the sticker. Cannot send back.")
-else:
-    print("Sticker download failed. Cannot proceed with editing and sending.")
+        result_sticker_path = edit_sticker(template, downloaded_sticker_path, edited_sticker_path)
+        if not result_sticker_path:
+            print("Failed to edit the sticker. Cannot send back.")
+            return 1
+        store.commit(result_sticker_path)
+
+    # Step 3: Send the edited sticker back to the sender
+    send_sticker(driver, sender_name, result_sticker_path)
+
+    # Do NOT close the browser to maintain the session
+    # driver.quit()
+    return 0
+
+def render_only(overlay_path, output_path=None, template_name=None):
+    if not os.path.exists(overlay_path):
+        print(f"Overlay image '{overlay_path}' not found.")
+        return 1
+    template = load_template(template_name)
+    if template is None:
+        return 1
+    if output_path is None:
+        stem = os.path.splitext(os.path.basename(overlay_path))[0]
+        output_path = f"edited_{stem}.webp"
+    return 0 if edit_sticker(template, overlay_path, output_path) else 1
+
+def main(argv):
+    if len(argv) in (2, 3, 4) and argv[0] == 'render':
+        return render_only(*argv[1:])
+    if len(argv) != 2:
+        print(USAGE)
+        return 1
+    return handle_sticker(argv[0], argv[1])
+
+# ====================== Execution ======================
 
-# Do NOT close the browser to maintain the session
-# driver.quit()
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
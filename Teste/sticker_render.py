@@ -0,0 +1,254 @@
+# sticker_render.py
+#
+# Shirt compositing used by sticker_handler.py.
+#
+# Stickers are composited directly at output size (512x512 by default) on a
+# pre-scaled template from shirt_templates.py and encoded by
+# sticker_encode.py. Animated overlays (animated WebP or GIF stickers) are
+# streamed frame by frame into the animated WebP encoder: only the current
+# source frame, its resized copy and a single canvas are alive at any time,
+# so memory does not grow with the animation's length.
+#
+# Large overlays (photos instead of 512px stickers) are shrunk cheaply
+# first: JPEG draft decoding and integer Image.reduce() get close to the
+# target size, and LANCZOS is only used for the last step.
+
+from PIL import Image, ImageChops
+
+from sticker_encode import (
+    ANIMATED_LIMIT_BYTES, DEFAULT_PRESET, STATIC_LIMIT_BYTES, STICKER_SIZE,
+    animated_encoder, encode_to_budget, static_encoder,
+)
+
+# ====================== Configuration ======================
+
+OVERLAY_SCALE = 0.5  # Without a print area, the overlay is resized to 50%
+DEFAULT_FRAME_DURATION = 100  # ms, used when a frame carries no duration
+
+# Decompression-bomb guard, checked from the header before anything is decoded
+MAX_INPUT_PIXELS = 40_000_000  # per frame
+MAX_ANIMATION_PIXELS = 200_000_000  # all frames together
+
+# Integer reduction stops once the image is within this factor of the target,
+# leaving the final LANCZOS step enough pixels to filter
+REDUCING_GAP = 2
+REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA")
+
+# ====================== Helper Functions ======================
+
+def scaled_size(size, scale=OVERLAY_SCALE):
+    width, height = size
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+def centered_box(base_size, overlay_size):
+    """
+    Returns the (left, top, right, bottom) box that centers the overlay on the base.
+    """
+    base_width, base_height = base_size
+    overlay_width, overlay_height = overlay_size
+    left = (base_width - overlay_width) // 2
+    top = (base_height - overlay_height) // 2
+    return (left, top, left + overlay_width, top + overlay_height)
+
+def offset_box(box, base_size, offset):
+    """
+    Moves box by offset = (dx, dy), given as fractions of the base width and
+    height, keeping it on the base where it fits.
+    """
+    dx = round(offset[0] * base_size[0])
+    dy = round(offset[1] * base_size[1])
+    width, height = box[2] - box[0], box[3] - box[1]
+    left = min(max(box[0] + dx, 0), max(base_size[0] - width, 0)) if width <= base_size[0] else box[0]
+    top = min(max(box[1] + dy, 0), max(base_size[1] - height, 0)) if height <= base_size[1] else box[1]
+    return (left, top, left + width, top + height)
+
+def overlay_box(template, size, overlay_size, scale=OVERLAY_SCALE, offset=None):
+    """
+    Returns the box the overlay is pasted into on template.base(size).
+    Templates with a print area get the overlay fitted inside it; otherwise
+    the overlay is scaled relative to the full-resolution shirt and centered.
+    An offset (dx, dy), in fractions of the base size, moves it from there.
+    """
+    base_image, factor = template.base(size)
+    print_area = template.print_area_at(size)
+    if print_area is None:
+        box = centered_box(base_image.size, scaled_size(overlay_size, scale * factor))
+    else:
+        left, top, right, bottom = print_area
+        area_size = (right - left, bottom - top)
+        fit = min(area_size[0] / overlay_size[0], area_size[1] / overlay_size[1])
+        box = centered_box(area_size, scaled_size(overlay_size, fit))
+        box = (left + box[0], top + box[1], left + box[2], top + box[3])
+    if offset:
+        box = offset_box(box, base_image.size, offset)
+    return box
+
+def paste_overlay(canvas, overlay, box, mask_patch=None):
+    # Paste the overlay image onto the base image with transparency
+    alpha = overlay.getchannel("A")
+    if mask_patch is not None:
+        # Clip the overlay to the printable part of the print area
+        alpha = ImageChops.multiply(alpha, mask_patch)
+    canvas.paste(overlay, box[:2], alpha)
+
+# ====================== Downscaling ======================
+
+def check_input_size(image):
+    """
+    Rejects overlays whose decoded size would be unreasonable.
+    Raises ValueError; only the header has been read at this point.
+    """
+    pixels = image.width * image.height
+    frames = getattr(image, "n_frames", 1)
+    if pixels > MAX_INPUT_PIXELS or pixels * frames > MAX_ANIMATION_PIXELS:
+        raise ValueError(f"Overlay too large: {image.width}x{image.height}, {frames} frame(s)")
+
+def use_draft(image, size):
+    """
+    Lets the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding, never
+    going below `size`. No-op for other formats.
+    """
+    if image.format == "JPEG":
+        image.draft("RGB", size)
+
+def reduce_overlay(image, size):
+    """
+    Cheap integer box reduction towards `size` (Image.reduce), in the
+    image's native mode. Returns an RGBA image at least REDUCING_GAP times
+    larger than `size` whenever the input allows.
+    """
+    if image.mode not in REDUCIBLE_MODES:
+        image = image.convert("RGBA")
+    factor = min(image.width // (size[0] * REDUCING_GAP), image.height // (size[1] * REDUCING_GAP))
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image.convert("RGBA")
+
+def finish_overlay(image, size):
+    # Final high-quality step on the already reduced image
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+def same_frame(a, b):
+    # getbbox() on RGBA only looks at alpha by default; colour changes count too
+    return ImageChops.difference(a, b).getbbox(alpha_only=False) is None
+
+# ====================== Animated Compositing ======================
+
+class AnimatedComposite:
+    """
+    Composites the overlay's frames onto the base lazily, one frame per seek().
+
+    The WebP encoder treats this object as a multi-frame image: it reads
+    n_frames, calls seek(idx) and takes the pixels of the current frame. The
+    first overlay frame is produced by first_frame() and handed to save();
+    this object then streams the remaining frames. Frame durations are
+    appended to self.durations as frames are read, just before the encoder
+    looks them up.
+    """
+
+    mode = "RGBA"
+
+    def __init__(self, base_image, overlay_image, box, mask_patch=None):
+        self.overlay_image = overlay_image
+        self.size = base_image.size
+        self.n_frames = overlay_image.n_frames - 1
+        self.durations = []
+        self.frames_composited = 0
+        self.frames_reused = 0
+
+        self._canvas = base_image.copy()
+        self._box = box
+        self._scaled_size = (box[2] - box[0], box[3] - box[1])
+        self._mask_patch = mask_patch
+        # Only the print area changes between frames, so restore just that
+        self._base_patch = base_image.crop(self._box)
+        self._previous = None
+
+    def first_frame(self):
+        self._render(0)
+        return self._canvas
+
+    def seek(self, idx):
+        self._render(idx + 1)
+
+    def tell(self):
+        return self.overlay_image.tell() - 1
+
+    @property
+    def im(self):
+        return self._canvas.im
+
+    def getim(self):
+        return self._canvas.getim()
+
+    def _render(self, idx):
+        self.overlay_image.seek(idx)
+        # The frame's duration is only filled in once the frame is decoded
+        frame = reduce_overlay(self.overlay_image, self._scaled_size)
+        self.durations.append(self.overlay_image.info.get("duration") or DEFAULT_FRAME_DURATION)
+
+        # Identical frame: the canvas already holds the right pixels
+        if self._previous is not None and same_frame(frame, self._previous):
+            self.frames_reused += 1
+            return
+        self._previous = frame
+
+        overlay = finish_overlay(frame, self._scaled_size)
+        self._canvas.paste(self._base_patch, self._box)
+        paste_overlay(self._canvas, overlay, self._box, self._mask_patch)
+        self.frames_composited += 1
+
+# ====================== Rendering ======================
+
+def composite_static(base_image, overlay_image, box, mask_patch=None):
+    size = (box[2] - box[0], box[3] - box[1])
+    overlay_image = finish_overlay(reduce_overlay(overlay_image, size), size)
+
+    result = base_image.copy()
+    paste_overlay(result, overlay_image, box, mask_patch)
+    return result
+
+def render_overlay(template, overlay_file, scale=OVERLAY_SCALE, preset=DEFAULT_PRESET,
+                   max_bytes=None, size=STICKER_SIZE, offset=None):
+    """
+    Overlays the sticker (a path or a binary file object) onto a
+    shirt_templates.ShirtTemplate and encodes it as WEBP. Animated stickers
+    keep every frame and its duration. The output is rendered at `size` and
+    encoded to stay under max_bytes (WhatsApp's sticker limit by default).
+    Only the default limits have their encoder settings remembered; a
+    caller's own max_bytes is searched from scratch every time.
+    offset=(dx, dy) moves the overlay by fractions of the output size.
+    Returns the sticker_encode.EncodeResult; the bytes are in result.data.
+    """
+    base_image, _ = template.base(size)
+    mask = template.mask_at(size)
+
+    with Image.open(overlay_file) as overlay_image:
+        check_input_size(overlay_image)
+        box = overlay_box(template, size, overlay_image.size, scale, offset)
+        use_draft(overlay_image, (box[2] - box[0], box[3] - box[1]))
+        mask_patch = mask.crop(box) if mask is not None else None
+        animated = getattr(overlay_image, "is_animated", False)
+        if animated:
+            encode = animated_encoder(
+                lambda: AnimatedComposite(base_image, overlay_image, box, mask_patch),
+                loop=overlay_image.info.get("loop", 0)
+            )
+        else:
+            encode = static_encoder(composite_static(base_image, overlay_image, box, mask_patch))
+        if max_bytes is not None:
+            return encode_to_budget(encode, max_bytes, preset, animated=animated)
+        max_bytes = ANIMATED_LIMIT_BYTES if animated else STATIC_LIMIT_BYTES
+        return encode_to_budget(encode, max_bytes, preset, template.name, animated)
+
+def render_sticker(template, overlay_image_path, output_image_path,
+                   scale=OVERLAY_SCALE, preset=DEFAULT_PRESET, max_bytes=None, size=STICKER_SIZE):
+    """
+    render_overlay() from a file to a file. Returns the EncodeResult.
+    """
+    result = render_overlay(template, overlay_image_path, scale, preset, max_bytes, size)
+    with open(output_image_path, 'wb') as f:
+        f.write(result.data)
+    return result
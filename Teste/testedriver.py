@@ -11,6 +11,7 @@ import time
 from urllib.parse import urlparse
 import base64
 import json
+from poll_scheduler import PollScheduler
 
 # ====================== Configuration ======================
 
@@ -27,8 +28,8 @@ USER_DATA_DIR = os.path.abspath("User_Data_Selenium")
 # WhatsApp Web URL
 WA_WEB_URL = 'https://web.whatsapp.com/'
 
-# Time to wait between checks (in seconds)
-CHECK_INTERVAL = 10
+# Seconds between polling reports; the wait between checks adapts to activity
+POLL_LOG_INTERVAL = 600
 
 # Path to the JSON file tracking processed senders
 PROCESSED_SENDERS_FILE = os.path.join(os.getcwd(), 'processed_senders.json')
@@ -227,6 +228,8 @@ def get_all_text_messages():
 
 print("Monitoring incoming messages for stickers and control commands...")
 
+poller = PollScheduler(log_interval=POLL_LOG_INTERVAL)
+
 try:
     while True:
         try:
@@ -234,7 +237,8 @@ try:
             sender_name = get_current_chat_name()
             if not sender_name:
                 print("Sender name not found. Skipping this iteration.")
-                time.sleep(CHECK_INTERVAL)
+                poller.idle()
+                poller.wait(driver)
                 continue
             
             # Check for control messages ("0")
@@ -242,17 +246,19 @@ try:
             for message in text_messages:
                 if message == "0":
                     # Reset the sender's status
-                    if sender_name in processed_senders:
+                    if processed_senders.get(sender_name):
                         processed_senders[sender_name] = False
                         save_processed_senders(PROCESSED_SENDERS_FILE, processed_senders)
                         print(f"Sender '{sender_name}' has been reset and can send one more sticker.")
+                        poller.detected()
             
             # Locate all incoming sticker images using the updated class
             sticker_elements = driver.find_elements(By.XPATH, '//img[contains(@class, "_ajxb _ajxj _ajxd")]')
             
             # If no stickers found, continue
             if not sticker_elements:
-                time.sleep(CHECK_INTERVAL)
+                poller.idle()
+                poller.wait(driver)
                 continue
             
             # Assume the last sticker in the list is the most recent
@@ -272,13 +278,15 @@ try:
                         processed_senders[sender_name] = True
                         save_processed_senders(PROCESSED_SENDERS_FILE, processed_senders)
                         print(f"Processed sticker from '{sender_name}'. Further stickers from this sender will be ignored until they send '0'.")
+                        poller.detected()
                 else:
                     print(f"Already processed sticker from '{sender_name}'. Waiting for control message '0'.")
+                    poller.idle()
             
         except Exception as inner_e:
             print(f"Error during sticker processing: {inner_e}")
         
-        time.sleep(CHECK_INTERVAL)
+        poller.wait(driver)
         
 except KeyboardInterrupt:
     print("Exiting script...")
@@ -1,8 +1,21 @@
 # whatsapp_monitor.py
+#
+# Usage: python whatsapp_monitor.py
+#
+# Everything runs from main(). The module must stay importable without side
+# effects: render workers are separate processes, and on Windows they
+# re-import this file.
 
-import subprocess
 import os
 import time
+from blob_prefetch import BlobPrefetcher
+from browser_governor import BrowserGovernor
+from media_store import MediaStore
+from poll_scheduler import PollScheduler
+from render_workers import RenderPool
+from send_scheduler import CONTROL, STICKER, TEXT, SendScheduler
+from session_table import SessionTable
+from sticker_handler import send_sticker
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.chrome.options import Options
@@ -14,57 +27,93 @@ from selenium.webdriver.support import expected_conditions as EC
 
 CHROMEDRIVER_PATH = r"./chromedriver.exe"  # Update this path if necessary
 DOWNLOAD_DIR = os.path.join(os.getcwd(), 'stickers')
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+MEDIA_QUOTA_BYTES = 512 * 1024 * 1024  # stickers/ is trimmed back under this
+STORE_REPORT_INTERVAL = 600  # seconds between media store reports
 USER_DATA_DIR = os.path.abspath("User_Data_Selenium")
 WA_WEB_URL = 'https://web.whatsapp.com/'
-CHECK_INTERVAL = 10  # seconds
 REMOTE_DEBUGGING_PORT = 9222  # Must match in sticker_handler.py
+# Jobs run between two chat reads. A sticker upload takes seconds, so the
+# rest wait for the end of the pass instead of holding up the next chat.
+JOBS_BETWEEN_CHATS = 1
+
+driver = None  # Set by main()
+media_store = None  # Finished stickers are written here for upload
+render_pool = None  # Renders stickers in worker processes
 
 # ====================== Setup Chrome Options ======================
 
-chrome_options = Options()
-chrome_options.add_argument(f"--user-data-dir={USER_DATA_DIR}")  # Persist session
-chrome_options.add_argument("--profile-directory=Default")
-chrome_options.add_argument("--start-maximized")
-chrome_options.add_argument(f"--remote-debugging-port={REMOTE_DEBUGGING_PORT}")  # Enable remote debugging
-chrome_options.add_argument("--disable-extensions")
-chrome_options.add_argument("--disable-infobars")
-chrome_options.add_argument("--disable-notifications")
-chrome_options.add_argument("--disable-popup-blocking")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--window-size=1920,1080")
-
-# Initialize WebDriver
-service = ChromeService(executable_path=CHROMEDRIVER_PATH)
-driver = webdriver.Chrome(service=service, options=chrome_options)
+def build_chrome_options():
+    chrome_options = Options()
+    chrome_options.add_argument(f"--user-data-dir={USER_DATA_DIR}")  # Persist session
+    chrome_options.add_argument("--profile-directory=Default")
+    chrome_options.add_argument("--start-maximized")
+    chrome_options.add_argument(f"--remote-debugging-port={REMOTE_DEBUGGING_PORT}")  # Enable remote debugging
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-infobars")
+    chrome_options.add_argument("--disable-notifications")
+    chrome_options.add_argument("--disable-popup-blocking")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    return chrome_options
 
 # ====================== Wait for Login ======================
 
-driver.get(WA_WEB_URL)
-print("Please scan the QR code to log in to WhatsApp Web.")
+def wait_for_chat_list(timeout=60):
+    """Waits for the chat search box, which only shows once logged in."""
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.XPATH, '//div[@contenteditable="true"][@data-tab="3"]'))
+        )
+        return True
+    except:
+        return False
+
+def wait_for_login():
+    driver.get(WA_WEB_URL)
+    print("Please scan the QR code to log in to WhatsApp Web.")
 
-try:
-    WebDriverWait(driver, 60).until(
-        EC.presence_of_element_located((By.XPATH, '//div[@contenteditable="true"][@data-tab="3"]'))
-    )
-    print("Logged in successfully!")
-except:
+    if wait_for_chat_list():
+        print("Logged in successfully!")
+        return True
     print("Failed to log in within the expected time.")
-    driver.quit()
-    exit()
+    return False
 
 # ====================== Helper Functions ======================
 
-def download_and_send(sender, sticker_url):
-    try:
-        # Invoke the sticker_handler.py script with sender and sticker_url as arguments
-        subprocess.Popen(['python', 'sticker_handler.py', sender, sticker_url])
-        print(f"Invoked sticker_handler for sender: {sender}")
-    except Exception as e:
-        print(f"Failed to invoke sticker_handler: {e}")
+def flush_prefetch():
+    """
+    Fetches every sticker seen since the last flush in one browser call and
+    hands the bytes to the render workers. A sender whose sticker could not
+    be read is released so they can send it again.
+    """
+    if not len(prefetcher):
+        return
+    for sender, sticker_url, data in prefetcher.flush(driver):
+        if not data:
+            print(f"Failed to capture sticker from {sender}. They can send it again.")
+            sessions.set_processed(sender, False)
+            continue
+        render_pool.submit(sender, data)
+        print(f"Queued sticker from {sender} for rendering ({len(data)} bytes).")
+
+def collect_renders():
+    """
+    Picks up finished renders and queues them for delivery. The browser's
+    file input needs a path, so this is where the sticker hits the disk.
+    A sender whose sticker failed to render is released to send another.
+    """
+    for sender, data in render_pool.collect():
+        if data is None:
+            print(f"No sticker for {sender}. They can send it again.")
+            sessions.set_processed(sender, False)
+            continue
+        sticker_path = media_store.put(data, 'edited', '.webp')
+        scheduler.submit(sender, STICKER,
+                         lambda sender=sender, path=sticker_path: send_sticker(driver, sender, path),
+                         "sticker")
 
 def get_unread_chats():
     """
@@ -90,10 +139,27 @@ def get_unread_chats():
         print(f"Error finding unread chats: {e}")
         return []
 
+def get_active_chat_name():
+    """
+    Returns the name shown in the header of the currently open chat, or None.
+    """
+    try:
+        # Only the conversation pane; the chat list has a header of its own
+        headers = driver.find_elements(
+            By.XPATH, '//div[@id="main"]//header//div[@role="button"]//span[@dir="auto"]')
+        if not headers:
+            return None
+        return headers[0].get_attribute('title') or headers[0].text
+    except:
+        return None
+
 def get_latest_message():
     """
     Retrieves the latest message type and content in the currently active chat.
-    Returns a tuple (msg_type, content):
+    Returns a tuple (cursor, msg_type, content):
+        - cursor: what identifies the message for `sessions.advance`, its
+          data-id when it has one (a sticker's blob URL changes on every
+          page load, the data-id does not), else (msg_type, content)
         - msg_type: "sticker", "text", or None
         - content: Sticker URL or text content
     """
@@ -101,29 +167,50 @@ def get_latest_message():
         # Locate all incoming message containers
         messages = driver.find_elements(By.XPATH, '//div[contains(@class, "message-in")]')
         if not messages:
-            return None, None
+            return None, None, None
         
         latest_message = messages[-1]
+        msg_type, content = None, None
         
         # Check if the latest message contains an image (sticker)
         try:
             sticker = latest_message.find_element(By.XPATH, './/img')
-            return "sticker", sticker.get_attribute('src')
+            msg_type, content = "sticker", sticker.get_attribute('src')
         except:
-            pass
+            # If not a sticker, get the text content
+            try:
+                text = latest_message.find_element(By.XPATH, './/span[@class="_ao3e selectable-text copyable-text"]').text.strip()
+                msg_type, content = "text", text
+            except:
+                return None, None, None
         
-        # If not a sticker, get the text content
         try:
-            text = latest_message.find_element(By.XPATH, './/span[@class="_ao3e selectable-text copyable-text"]').text.strip()
-            return "text", text
+            msg_id = latest_message.find_element(
+                By.XPATH, './ancestor-or-self::div[@data-id][1]').get_attribute('data-id')
         except:
-            return None, None
+            msg_id = None
+        return msg_id or (msg_type, content), msg_type, content
+    except:
+        return None, None, None
+
+def open_chat(sender):
+    """
+    Opens the sender's chat. Returns True if it could be opened.
+    """
+    try:
+        chat = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, f'//span[@title="{sender}"]'))
+        )
+        chat.click()
+        return True
     except:
-        return None, None
+        print(f"Failed to open chat with {sender}.")
+        return False
 
 def send_text_message(sender, message):
     """
     Sends a text message to the specified sender.
+    The sender's chat must be the active one.
     """
     try:
         # Locate the message input box using the provided XPath
@@ -141,6 +228,15 @@ def send_text_message(sender, message):
     except Exception as e:
         print(f"Failed to send message to {sender}: {e}")
 
+def reply(sender, message):
+    """
+    Scheduled text reply: other chats may have been opened since the
+    message was read, so reopen the sender's chat first.
+    """
+    if open_chat(sender):
+        time.sleep(1)  # Wait for chat to open
+        send_text_message(sender, message)
+
 # ====================== Define Trigger Messages and Responses ======================
 
 # List of possible trigger messages from senders
@@ -157,149 +253,247 @@ responses = [
     "Hello there! How can I help you?"
 ]
 
-# ====================== Main Monitoring Loop ======================
+# ====================== Message Handling ======================
 
-processed_senders = set()
-responded_messages = {}  # Dictionary to track which trigger messages have been responded to per sender
-open_chats = {}  # Dictionary to track open chats and their statuses
+# One record per sender: sticker processed flag, trigger replies already sent,
+# and the watched chat (last activity and last message handled). Idle chats
+# stop being watched and senders idle past the session TTL are forgotten.
+sessions = SessionTable()
 
-print("Monitoring for new stickers and messages...")
+# Replies and sticker jobs go through the scheduler: control commands first,
+# then text replies, then sticker deliveries, fair across senders.
+scheduler = SendScheduler()
 
-try:
-    while True:
-        try:
-            # 1. Process unread senders
-            unread_senders = get_unread_chats()
-            
-            for sender in unread_senders:
-                if sender in processed_senders:
-                    continue  # Skip already processed senders unless reset is needed
-                
-                # Open the sender's chat
-                try:
-                    chat = WebDriverWait(driver, 10).until(
-                        EC.element_to_be_clickable((By.XPATH, f'//span[@title="{sender}"]'))
-                    )
-                    chat.click()
-                    print(f"Opened chat with {sender}.")
-                    open_chats[sender] = True  # Mark chat as open
-                except:
-                    print(f"Failed to open chat with {sender}.")
-                    continue
-                
-                time.sleep(1)  # Wait for chat to open
-                
-                # Get the latest message
-                msg_type, content = get_latest_message()
-                
-                # Debugging: Print message type and content
-                print(f"Latest message from {sender}: Type={msg_type}, Content='{content}'")
-                
-                if msg_type == "text":
-                    # Check if the message matches any trigger message
-                    for idx, trigger in enumerate(trigger_messages):
-                        if content.lower() == trigger.lower():
-                            # Initialize the set for sender if not present
-                            if sender not in responded_messages:
-                                responded_messages[sender] = set()
-                            
-                            # Check if this trigger has already been responded to
-                            if trigger.lower() not in responded_messages[sender]:
-                                response = responses[idx]
-                                send_text_message(sender, response)
-                                # Mark this trigger as responded to for the sender
-                                responded_messages[sender].add(trigger.lower())
-                            else:
-                                print(f"Already responded to '{trigger}' from {sender}.")
-                            break  # Exit the loop after finding a match
-                    else:
-                        # If the message is "0" or other text not in trigger_messages
-                        if content.lower() == "0":
-                            if sender in processed_senders:
-                                processed_senders.remove(sender)
-                                print(f"Reset received from {sender}. They can send a new sticker now.")
-                            else:
-                                print(f"Received '0' from {sender}, but they were not in processed_senders.")
-                            # Remove any tracked responded message
-                            responded_messages.pop(sender, None)
-                elif msg_type == "sticker":
-                    if sender not in processed_senders:
-                        download_and_send(sender, content)
-                        processed_senders.add(sender)
-                        print(f"Processed sticker from {sender}. Awaiting reset command ('0').")
-                        # Remove any tracked responded message
-                        responded_messages.pop(sender, None)
-                    else:
-                        print(f"Sticker from {sender} ignored (already processed).")
+# Sticker blobs seen during a pass, fetched together at the end of it
+prefetcher = BlobPrefetcher()
+
+# Sub-second polling while chats are active, backing off when idle
+poller = PollScheduler()
+
+# Reloads the tab when its heap, DOM or WebDriver latency grows too large
+governor = BrowserGovernor()
+
+def reset_sender(sender):
+    if sessions.is_processed(sender):
+        sessions.set_processed(sender, False)
+        print(f"Reset received from {sender}. They can send a new sticker now.")
+    else:
+        print(f"Received '0' from {sender}, but they were not processed.")
+    # Remove any tracked responded message
+    sessions.clear_responded(sender)
+
+def handle_message(sender, msg_type, content):
+    """
+    Decides what to do with the latest message from sender and queues it.
+    State is updated right away so the next scan does not queue it twice.
+    """
+    if msg_type == "text":
+        # Check if the message matches any trigger message
+        for idx, trigger in enumerate(trigger_messages):
+            if content.lower() == trigger.lower():
+                # Check if this trigger has already been responded to
+                if not sessions.has_responded(sender, idx):
+                    response = responses[idx]
+                    scheduler.submit(sender, TEXT, lambda: reply(sender, response), trigger)
+                    # Mark this trigger as responded to for the sender
+                    sessions.mark_responded(sender, idx)
                 else:
-                    print(f"No action taken for message from {sender}.")
-                
-                # Keep the chat open for this sender to monitor for reset commands
-                # Do not close the chat
-            
-            # 2. Monitor open chats for new messages (like reset commands and additional triggers)
-            for sender in list(open_chats.keys()):
-                try:
-                    # Ensure the chat is still open by checking if the chat window is active
-                    active_chat = WebDriverWait(driver, 5).until(
-                        EC.presence_of_element_located((By.XPATH, f'//span[@title="{sender}"]'))
-                    )
-                    # If chat is active, check for new messages
-                    msg_type, content = get_latest_message()
-                    
-                    # Debugging: Print message type and content
-                    print(f"Latest message in open chat with {sender}: Type={msg_type}, Content='{content}'")
-                    
-                    if msg_type == "text":
-                        # Check if the message matches any trigger message
-                        for idx, trigger in enumerate(trigger_messages):
-                            if content.lower() == trigger.lower():
-                                # Initialize the set for sender if not present
-                                if sender not in responded_messages:
-                                    responded_messages[sender] = set()
-                                
-                                # Check if this trigger has already been responded to
-                                if trigger.lower() not in responded_messages[sender]:
-                                    response = responses[idx]
-                                    send_text_message(sender, response)
-                                    # Mark this trigger as responded to for the sender
-                                    responded_messages[sender].add(trigger.lower())
-                                else:
-                                    print(f"Already responded to '{trigger}' from {sender}.")
-                                break  # Exit the loop after finding a match
-                        else:
-                            # If the message is "0" or other text not in trigger_messages
-                            if content.lower() == "0":
-                                if sender in processed_senders:
-                                    processed_senders.remove(sender)
-                                    print(f"Reset received from {sender}. They can send a new sticker now.")
-                                else:
-                                    print(f"Received '0' from {sender}, but they were not in processed_senders.")
-                                # Remove any tracked responded message
-                                responded_messages.pop(sender, None)
-                    elif msg_type == "sticker":
-                        if sender not in processed_senders:
-                            download_and_send(sender, content)
-                            processed_senders.add(sender)
-                            print(f"Processed sticker from {sender}. Awaiting reset command ('0').")
-                            # Remove any tracked responded message
-                            responded_messages.pop(sender, None)
-                        else:
-                            print(f"Sticker from {sender} ignored (already processed).")
-                    else:
-                        print(f"No action taken for new message in chat with {sender}.")
-                
-                except:
-                    # If chat is not active, it might have been closed manually; remove from open_chats
-                    print(f"Chat with {sender} is no longer open.")
-                    del open_chats[sender]
-        
-        except Exception as inner_e:
-            print(f"Error during monitoring loop: {inner_e}")
+                    print(f"Already responded to '{trigger}' from {sender}.")
+                break  # Exit the loop after finding a match
+        else:
+            # If the message is "0" or other text not in trigger_messages
+            if content.lower() == "0":
+                scheduler.submit(sender, CONTROL, lambda: reset_sender(sender), "reset", sends=False)
+        return True
+    elif msg_type == "sticker":
+        if not sessions.is_processed(sender):
+            prefetcher.add(sender, content)
+            sessions.set_processed(sender)
+            print(f"Processed sticker from {sender}. Awaiting reset command ('0').")
+            # Remove any tracked responded message
+            sessions.clear_responded(sender)
+        else:
+            print(f"Sticker from {sender} ignored (already processed).")
+        return True
+    return False
+
+# ====================== Main Monitoring Loop ======================
+
+def start_pipeline(web_driver, store_dir=DOWNLOAD_DIR, quota_bytes=MEDIA_QUOTA_BYTES):
+    """
+    Starts the media store sweeper and the render workers around a logged-in
+    driver. soak_test.py calls this with a stand-in driver.
+    """
+    global driver, media_store, render_pool
+
+    driver = web_driver
+    # Finished stickers are written here for upload; the background sweeper
+    # keeps the directory under its quota.
+    media_store = MediaStore(store_dir, quota_bytes)
+    media_store.start_background()
+    render_pool = RenderPool()
+
+def stop_pipeline():
+    render_pool.shutdown()
+    media_store.stop_background()
+
+def report():
+    print(f"Media store: {media_store.describe()}")
+    print(f"Send queue: {scheduler.describe()}, {render_pool.pending()} rendering")
+    print(f"Sticker prefetch: {prefetcher.describe()}")
+    print(f"Polling: {poller.describe()}")
+    print(f"Browser: {governor.describe()}")
+    s = sessions.stats()
+    print(f"Sessions: {s['sessions']} senders, {s['processed']} awaiting reset, {s['expired']} expired; "
+          f"watched chats {s['hot']} hot, {s['cold']} cold, {s['evicted']} evicted")
+
+def monitor_pass():
+    """One scan: unread chats, then watched chats, then whatever is ready to send."""
+    # 1. Process unread senders
+    unread_senders = get_unread_chats()
+
+    for sender in unread_senders:
+        # Processed senders are read too: their chat may no longer be
+        # watched, and their "0" has to get through
+    
+        # Open the sender's chat
+        if not open_chat(sender):
+            continue
+        print(f"Opened chat with {sender}.")
+        sessions.touch(sender)  # Keep watching this chat while it is active
+    
+        time.sleep(1)  # Wait for chat to open
+    
+        # Get the latest message
+        cursor, msg_type, content = get_latest_message()
+    
+        # Debugging: Print message type and content
+        print(f"Latest message from {sender}: Type={msg_type}, Content='{content}'")
+    
+        sessions.advance(sender, cursor)
+        poller.detected()
+        if not handle_message(sender, msg_type, content):
+            print(f"No action taken for message from {sender}.")
+    
+        # Send the most urgent job before reading the next chat
+        collect_renders()
+        scheduler.run_ready(max_jobs=JOBS_BETWEEN_CHATS)
+    
+        # Keep the chat open for this sender to monitor for reset commands
+        # Do not close the chat
+    
+    # Fetch the stickers seen in this pass while their blobs are fresh
+    flush_prefetch()
+
+    # The open chat never shows an unread badge, so read it even after it
+    # stopped being watched. A chat the table does not know (say, one the
+    # operator opened) only gets its cursor recorded: its current message
+    # is not handled and the chat is not watched, but a newer one will be.
+    active = get_active_chat_name()
+    if active and not sessions.watching(active):
+        cursor, msg_type, content = get_latest_message()
+        if active not in sessions:
+            sessions.set_cursor(active, cursor)
+        elif sessions.advance(active, cursor):
+            poller.detected()
+            print(f"Latest message in open chat with {active}: Type={msg_type}, Content='{content}'")
+            if not handle_message(active, msg_type, content):
+                print(f"No action taken for new message in chat with {active}.")
+
+    # 2. Monitor recently active chats for new messages (like reset commands and additional triggers)
+    for sender in sessions.due():
+        # Read the sender's own chat, not whichever chat happens to be open
+        if get_active_chat_name() != sender:
+            if not open_chat(sender):
+                # Chat no longer listed; its unread badge will bring it back
+                print(f"Chat with {sender} is no longer open.")
+                sessions.unwatch(sender)
+                continue
+            time.sleep(1)  # Wait for chat to open
+            if get_active_chat_name() != sender:
+                sessions.mark_checked(sender)
+                continue
+    
+        cursor, msg_type, content = get_latest_message()
+        if not sessions.advance(sender, cursor):
+            continue  # Nothing new since the last check
+        poller.detected()
+    
+        # Debugging: Print message type and content
+        print(f"Latest message in open chat with {sender}: Type={msg_type}, Content='{content}'")
+    
+        if not handle_message(sender, msg_type, content):
+            print(f"No action taken for new message in chat with {sender}.")
+    
+        collect_renders()
+        scheduler.run_ready(max_jobs=JOBS_BETWEEN_CHATS)
+
+    # Stickers seen in the watched chats, then renders that finished
+    # while we were reading chats; everything ready goes out now
+    flush_prefetch()
+    collect_renders()
+    scheduler.run_ready()
+
+def is_idle():
+    """No hot chats and nothing waiting to be fetched, rendered or sent."""
+    return not (sessions.hot_count() or len(prefetcher) or render_pool.pending() or scheduler.pending())
+
+def reload_page():
+    """
+    Reloads the WhatsApp Web tab. The Chrome profile keeps the login and
+    every sender's state and cursor lives in `sessions`, so only the chat
+    that was open needs to be reopened. Cursors are message data-ids, which
+    survive the reload, so no chat's latest message looks new afterwards.
+    """
+    active = get_active_chat_name()
+    driver.refresh()
+    if not wait_for_chat_list():
+        raise RuntimeError("WhatsApp Web did not come back after the reload")
+    if active and open_chat(active):
+        time.sleep(1)  # Wait for chat to open
+
+def wait_for_next_pass():
+    # Stay fast while chats are hot or work is in flight, back off when
+    # idle; a change in the page ends the wait early
+    if is_idle():
+        poller.idle()
+    else:
+        poller.active()
+    poller.wait(driver, limit=scheduler.next_ready_in())
+
+def main():
+    global driver
+
+    # Initialize WebDriver
+    service = ChromeService(executable_path=CHROMEDRIVER_PATH)
+    driver = webdriver.Chrome(service=service, options=build_chrome_options())
+    if not wait_for_login():
+        driver.quit()
+        return
+
+    start_pipeline(driver)
+    print("Monitoring for new stickers and messages...")
+    last_store_report = time.time()
+
+    try:
+        while True:
+            if time.time() - last_store_report >= STORE_REPORT_INTERVAL:
+                report()
+                last_store_report = time.time()
+
+            try:
+                monitor_pass()
+                governor.check(driver, is_idle(), reload_page)
+            except Exception as inner_e:
+                print(f"Error during monitoring loop: {inner_e}")
         
-        time.sleep(CHECK_INTERVAL)
+            wait_for_next_pass()
+
+    except KeyboardInterrupt:
+        print("Script terminated by user.")
+    finally:
+        stop_pipeline()
+        driver.quit()
 
-except KeyboardInterrupt:
-    print("Script terminated by user.")
-finally:
-    driver.quit()
+if __name__ == '__main__':
+    main()